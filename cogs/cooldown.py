@@ -1,53 +1,156 @@
+import asyncio
 import os
-import sqlite3
 import discord
 from discord.ext import commands, tasks
 import datetime
 import json
-from .utils import checks
+from .utils import checks, reduction_tiers
+from .utils.level_roles import get_level_role_index, member_role_ids
+from .utils.member_levels import MemberLevelCache
+
+LOCK_STRIPES = 64  # Users share these locks; enough that bursts rarely collide
 
 
 class cooldown(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.permitted_roles = bot.config.get("permitted_roles")
-        self.cooldown_channels = bot.config.get("cooldown_channels")  # Return a dict.
+        self._compile_message_filters()
         self.log_channel_id = bot.config.get("log_channel_id")
         self.log_channel = self.bot.get_channel(self.log_channel_id)
-        self.db_path = "cooldown_database.db"  # Path to your database file
-        self.level_roles = self.get_level_roles()
+        self.level_roles = get_level_role_index(bot)
+        self._tiers_source = self._reduction_tiers_source()
+        self.reduction_tiers = reduction_tiers.compile_tiers(bot.config)
+        self.member_levels = MemberLevelCache(
+            size=bot.config.get("cooldown_member_cache_size", 10000)
+        )
+        self._level_roles_version = self.level_roles.version
+        self._cooldown_locks = tuple(asyncio.Lock() for _ in range(LOCK_STRIPES))
+        self.sweep_expired_cooldowns.change_interval(
+            minutes=bot.config.get("cooldown_sweep_minutes", 10)
+        )
+        self.sweep_expired_cooldowns.start()
+
+    def cog_unload(self):
+        self.sweep_expired_cooldowns.cancel()
+
+    @tasks.loop(minutes=10)
+    async def sweep_expired_cooldowns(self):
+        """Deletes expired rows from the cooldowns table."""
+        database = self.bot.get_cog("Database")
+        if not database:
+            return
+        reclaimed = await database.purge_expired_cooldowns(
+            batch_size=self.bot.config.get("cooldown_sweep_batch_size", 500)
+        )
+        print(f"Cooldown sweep reclaimed {reclaimed} expired rows.")
 
-    def get_level_roles(self):
+    @sweep_expired_cooldowns.before_loop
+    async def before_sweep_expired_cooldowns(self):
+        await self.bot.wait_until_ready()
+
+    def _user_lock(self, user_id):
+        """Returns the lock that serializes cooldown checks for a user."""
+        return self._cooldown_locks[hash(user_id) % LOCK_STRIPES]
+
+    def _compile_message_filters(self):
         """
-        Gets all roles that follow the format '[Level N] Name'
-        and stores them in self.level_roles.
+        Reads the cooldown channels and permitted roles from the config, and
+        compiles the integer ID sets that on_message checks first.
         """
-        level_roles = {}
-        for role in self.bot.guilds[0].roles:
-            try:
-                if not role.name.startswith("[Level "):
-                    continue  # Skip roles that don't match the format
+        self.permitted_roles = self.bot.config.get("permitted_roles") or []
+        self.cooldown_channels = self.bot.config.get("cooldown_channels")  # Return a dict.
+        # Copies of what the sets were built from, for on_config_reload to compare
+        self._filters_source = (dict(self.cooldown_channels), list(self.permitted_roles))
+        self._cooldown_channel_ids = frozenset(int(c) for c in self.cooldown_channels)
+        # guild_id -> frozenset of permitted role IDs, resolved from names on first use
+        self._permitted_role_ids = {}
+
+    def get_permitted_role_ids(self, guild: discord.Guild):
+        """Returns the IDs of the guild's roles that are exempt from cooldowns."""
+        role_ids = self._permitted_role_ids.get(guild.id)
+        if role_ids is None:
+            role_ids = self._permitted_role_ids[guild.id] = frozenset(
+                role.id
+                for role in guild.roles
+                if role.name in self.permitted_roles
+                or str(role.id) in self.permitted_roles
+            )
+        return role_ids
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self._permitted_role_ids.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        if before.name != after.name:  # Permitted roles can be listed by name
+            self._permitted_role_ids.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self._permitted_role_ids.pop(role.guild.id, None)
+
+    def _reduction_tiers_source(self):
+        return (
+            self.bot.config.get("cooldown_reduction_tiers"),
+            self.bot.config.get("cooldown_reduce_by", 0),
+        )
+
+    @commands.Cog.listener()
+    async def on_config_reload(self):
+        """
+        Recompiles the message filters and the cooldown reduction tiers if
+        the new config changed them.
+        """
+        if self._filters_source != (
+            self.bot.config.get("cooldown_channels"),
+            self.bot.config.get("permitted_roles") or [],
+        ):
+            self._compile_message_filters()
 
-                level_str = role.name.split("]")[0]  # Get the part before the ']'
-                level_number = int(level_str.split("[Level ")[1])  # Extract the number
-                level_roles[level_number] = role.id
-            except (IndexError, ValueError):
-                pass  # Ignore roles that don't match the format
-        return level_roles
+        source = self._reduction_tiers_source()
+        if source == self._tiers_source:
+            return
+        try:
+            self.reduction_tiers = reduction_tiers.compile_tiers(self.bot.config)
+        except ValueError as e:
+            print(f"Keeping the old cooldown reduction tiers: {e}")
+            return
+        self._tiers_source = source
+        self.member_levels.clear()
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if set(member_role_ids(before)) != set(member_role_ids(after)):
+            self.member_levels.discard(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.member_levels.discard(member.guild.id, member.id)
 
     def get_user_level(self, user: discord.Member):
         """
-        Calculates the user's level multiplier based on their highest level role.
+        Returns the level of the user's highest level role, or 0 if they have none.
+        """
+        return self.level_roles.highest_level(user)
 
-        For every 20 levels, the user receives +1 to their multiplier, starting from 0.
+    def get_cooldown_reduction(self, user: discord.Member):
         """
-        highest_level = 0
-        for role in user.roles:
-            for level_number, role_id in self.level_roles.items():
-                if role.id == role_id and level_number > highest_level:
-                    highest_level = level_number
+        Returns how many minutes the user's cooldowns are shortened by, from
+        the reduction tier their highest level role reaches.
 
-        return highest_level // 20
+        The result is memoized per member until their roles, the level
+        roles or the tiers change.
+        """
+        if self._level_roles_version != self.level_roles.version:
+            self.member_levels.clear()  # Level roles were added, renamed or deleted
+            self._level_roles_version = self.level_roles.version
+        cached = self.member_levels.get(user.guild.id, user.id)
+        if cached is None:
+            level = self.get_user_level(user)
+            cached = (level, reduction_tiers.reduction_for(self.reduction_tiers, level))
+            self.member_levels.put(user.guild.id, user.id, *cached)
+        return cached[1]
 
     @commands.group(invoke_without_command=True, aliases=["cd"])
     @checks.is_mod()
@@ -104,7 +207,7 @@ class cooldown(commands.Cog):
                 json.dump(config, f, indent=4)
 
             self.bot.reload_config()
-            self.cooldown_channels = self.bot.config.get("cooldown_channels")
+            self._compile_message_filters()
 
         except Exception as e:
             print(f"Error setting cooldown: {e}")
@@ -123,6 +226,9 @@ class cooldown(commands.Cog):
             title=f"Cooldown Status for {user.name}", color=discord.Color.blue()
         )
 
+        # Every channel's cooldown end time, in one lookup
+        cooldowns = await self.bot.get_cog("Database").get_cooldowns_for_user(user.id)
+
         for channel_id, cooldown_duration in self.cooldown_channels.items():
             channel = self.bot.get_channel(int(channel_id))
             if not channel:
@@ -133,10 +239,7 @@ class cooldown(commands.Cog):
                 )
                 continue
 
-            # Get cooldown end time from the database
-            cooldown_end_time = await self.bot.get_cog("Database").get_cooldown(
-                str(user.id), channel_id
-            )
+            cooldown_end_time = cooldowns.get(int(channel_id))
 
             if cooldown_end_time:
                 now = datetime.datetime.now(datetime.timezone.utc)
@@ -172,23 +275,12 @@ class cooldown(commands.Cog):
         If a channel is specified, resets the cooldown only for that channel.
         Otherwise, resets all cooldowns for the user.
         """
-        user_id = str(user.id)
+        database = self.bot.get_cog("Database")
 
         if channel:
-            channel_id = str(channel.id)
             try:
                 # Delete the cooldown entry from the database
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    DELETE FROM cooldowns
-                    WHERE user_id = ? AND channel_id = ?
-                """,
-                    (user_id, channel_id),
-                )
-                conn.commit()
-                conn.close()
+                await database.reset_cooldowns(user.id, channel.id)
                 await ctx.send(
                     f":white_check_mark: Cooldown reset for {user.mention} in {channel.mention}."
                 )
@@ -210,17 +302,7 @@ class cooldown(commands.Cog):
         else:
             try:
                 # Delete all cooldown entries for the user from the database
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    DELETE FROM cooldowns
-                    WHERE user_id = ?
-                """,
-                    (user_id,),
-                )
-                conn.commit()
-                conn.close()
+                await database.reset_cooldowns(user.id)
                 await ctx.send(
                     f":white_check_mark: All cooldowns reset for {user.mention}."
                 )
@@ -240,26 +322,52 @@ class cooldown(commands.Cog):
                     f"An error occurred while resetting all cooldowns for {user.mention}."
                 )
 
+    @cooldown.command(aliases=["clearchannel"])
+    async def resetchannel(self, ctx, channel: discord.TextChannel):
+        """Resets the cooldown of every user in the selected channel."""
+        try:
+            deleted = await self.bot.get_cog("Database").reset_channel_cooldowns(
+                channel.id
+            )
+            await ctx.send(
+                f":white_check_mark: Reset {deleted} cooldown(s) in {channel.mention}."
+            )
+
+            # Log the reset action
+            if self.log_channel:
+                embed = discord.Embed(
+                    title="Cooldown Reset Command Used",
+                    description=f"{ctx.author.mention} used the `cooldown resetchannel` on {channel.mention}.",
+                    color=discord.Color.blue(),
+                )
+                embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+                await self.log_channel.send(embed=embed)
+        except Exception as e:
+            print(f"Error resetting channel cooldowns in database: {e}")
+            await ctx.send(
+                f"An error occurred while resetting the cooldowns in {channel.mention}."
+            )
+
     @commands.Cog.listener()
     async def on_message(self, message):
         """Handles the cooldown logic when a message is sent."""
+        # Most messages aren't in a cooldown channel; reject those first
+        if message.channel.id not in self._cooldown_channel_ids:
+            return
         if (
             message.author == self.bot.user
             or message.webhook_id
             or message.author.id == 470723870270160917
         ):
             return
+        if not self.get_permitted_role_ids(message.guild).isdisjoint(
+            member_role_ids(message.author)
+        ):
+            return  # Allow the message if the user has a permitted role
 
         channel_id = str(message.channel.id)
         if channel_id in self.cooldown_channels:
             now = datetime.datetime.now(datetime.timezone.utc)  # Define 'now' here
-            has_permitted_role = any(
-                role.name in self.permitted_roles
-                or str(role.id) in self.permitted_roles
-                for role in message.author.roles
-            )
-            if has_permitted_role:
-                return  # Allow the message if the user has a permitted role
 
             user_id = str(message.author.id)
 
@@ -267,92 +375,91 @@ class cooldown(commands.Cog):
             cooldown_duration = self.cooldown_channels[channel_id]
 
             # Calculate cooldown reduction based on user level
-            reduce_by = self.bot.config.get(
-                "cooldown_reduce_by", 0
-            ) * self.get_user_level(message.author)
+            reduce_by = self.get_cooldown_reduction(message.author)
             cooldown_duration -= reduce_by  # Reduce cooldown duration
-            # Get cooldown end time from the database for the specific channel
-            cooldown_end_time = await self.bot.get_cog("Database").get_cooldown(
-                user_id, channel_id
-            )
-
-            if cooldown_end_time is None or message.created_at > cooldown_end_time:
-                # No active cooldown or cooldown has expired, set a new cooldown for all channels
-                for channel_id, duration in self.cooldown_channels.items():
-                    new_cooldown_end_time = now + datetime.timedelta(
-                        minutes=duration - reduce_by
+            # Checking and setting the cooldown has to be atomic per user, or two
+            # posts landing together could both see no cooldown
+            async with self._user_lock(message.author.id):
+                # Get the user's cooldowns in every channel at once; the violation
+                # message below lists them all
+                cooldowns = await self.bot.get_cog(
+                    "Database"
+                ).get_cooldowns_for_user(user_id)
+                cooldown_end_time = cooldowns.get(message.channel.id)
+
+                if cooldown_end_time is None or message.created_at > cooldown_end_time:
+                    # No active cooldown or cooldown has expired, set a new cooldown for all channels
+                    await self.bot.get_cog("Database").insert_cooldowns(
+                        user_id,
+                        {
+                            channel_id: now
+                            + datetime.timedelta(minutes=duration - reduce_by)
+                            for channel_id, duration in self.cooldown_channels.items()
+                        },
                     )
-                    await self.bot.get_cog("Database").insert_cooldown(
-                        user_id, channel_id, new_cooldown_end_time
-                    )
-            else:
-                # Cooldown is active, handle violation
-
-                # Update cooldown end time for all channels in the database
+                    return
+
+            # Cooldown is active, handle violation
+
+            # Update cooldown end time for all channels in the database
+
+            remaining_time = (
+                cooldown_end_time - message.created_at
+            ).total_seconds() / 60
+
+            # Create cooldown information for all channels
+            cooldown_info = []
+            for channel_id, duration in self.cooldown_channels.items():
+                channel = self.bot.get_channel(int(channel_id))
+                if channel:
+                    # Expired cooldowns are evicted from the cache
+                    cooldown_end_time_channel = cooldowns.get(int(channel_id))
+                    if (
+                        cooldown_end_time_channel
+                        and cooldown_end_time_channel > message.created_at
+                    ):
+                        cooldown_info.append(
+                            f"{channel.mention}: {discord.utils.format_dt(cooldown_end_time_channel, 'R')}"
+                        )
+                    else:
+                        cooldown_info.append(f"{channel.mention}: No cooldown.")
 
-                remaining_time = (
-                    cooldown_end_time - message.created_at
-                ).total_seconds() / 60
+            # Create the embed with cooldown information for all channels
+            embed = discord.Embed(
+                title="Lewd Corder LFP Cooldown",
+                description=f"Do not try posting your Advertisement in all channels, choose one that fits your advertisement the most. Check <#920837349833855006> Rule 1 for more info.\n\n"
+                f"You can post again in:\n" + "\n".join(cooldown_info),
+                color=discord.Color.orange(),
+            )
+            embed.set_footer(text="Kind regards, LC Staff Team.")
 
-                # Create cooldown information for all channels
-                cooldown_info = []
-                for channel_id, duration in self.cooldown_channels.items():
-                    channel = self.bot.get_channel(int(channel_id))
-                    if channel:
-                        cooldown_end_time_channel = await self.bot.get_cog(
-                            "Database"
-                        ).get_cooldown(user_id, channel_id)
-                        if cooldown_end_time_channel:
-                            remaining_time_channel = (
-                                cooldown_end_time_channel - message.created_at
-                            ).total_seconds() / 60
-                            cooldown_expiry_channel = (
-                                message.created_at
-                                + datetime.timedelta(minutes=remaining_time_channel)
-                            )
-                            if remaining_time_channel > 0:
-                                cooldown_info.append(
-                                    f"{channel.mention}: {discord.utils.format_dt(cooldown_expiry_channel, 'R')}"
-                                )
-                            else:
-                                cooldown_info.append(f"{channel.mention}: No cooldown.")
-
-                # Create the embed with cooldown information for all channels
-                embed = discord.Embed(
-                    title="Lewd Corder LFP Cooldown",
-                    description=f"Do not try posting your Advertisement in all channels, choose one that fits your advertisement the most. Check <#920837349833855006> Rule 1 for more info.\n\n"
-                    f"You can post again in:\n" + "\n".join(cooldown_info),
-                    color=discord.Color.orange(),
-                )
-                embed.set_footer(text="Kind regards, LC Staff Team.")
+            try:
+                await message.author.send(embed=embed)
+                if self.log_channel:
+                    embed = discord.Embed(
+                        title="Cooldown Violation",
+                        description=f"{message.author.mention} tried to send a message in {message.channel.mention} but is on cooldown:\n\n"
+                        + "\n".join(cooldown_info),
+                        color=discord.Color.red(),
+                    )
+                    embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+                    embed.set_footer(text=f"{message.author.id}")
+                    await self.log_channel.send(embed=embed)
 
-                try:
-                    await message.author.send(embed=embed)
-                    if self.log_channel:
-                        embed = discord.Embed(
-                            title="Cooldown Violation",
-                            description=f"{message.author.mention} tried to send a message in {message.channel.mention} but is on cooldown:\n\n"
-                            + "\n".join(cooldown_info),
-                            color=discord.Color.red(),
-                        )
-                        embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-                        embed.set_footer(text=f"{message.author.id}")
-                        await self.log_channel.send(embed=embed)
-
-                except discord.HTTPException:
-                    if self.log_channel:
-                        embed = discord.Embed(
-                            title="Cooldown Violation | FAILED TO DM",
-                            description=f"{message.author.mention} tried to send a message in {message.channel.mention} but is on cooldown:\n\n"
-                            + "\n".join(cooldown_info),
-                            color=discord.Color.red(),
-                        )
-                        embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-                        embed.set_footer(text=f"{message.author.id}")
-                        await self.log_channel.send(embed=embed)
-                    print(f"Failed to DM {message.author}")
+            except discord.HTTPException:
+                if self.log_channel:
+                    embed = discord.Embed(
+                        title="Cooldown Violation | FAILED TO DM",
+                        description=f"{message.author.mention} tried to send a message in {message.channel.mention} but is on cooldown:\n\n"
+                        + "\n".join(cooldown_info),
+                        color=discord.Color.red(),
+                    )
+                    embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+                    embed.set_footer(text=f"{message.author.id}")
+                    await self.log_channel.send(embed=embed)
+                print(f"Failed to DM {message.author}")
 
-                await message.delete()
+            await message.delete()
 
     @cooldown.command()
     async def config(self, ctx):
@@ -413,47 +520,35 @@ class cooldown(commands.Cog):
     @checks.in_lc()
     async def debug_user(self, ctx, user: discord.Member):
         """Debugs cooldown status for a user in all cooldown channels."""
-        user_id = str(user.id)
+        level = self.get_user_level(user)
+        reduce_by = self.get_cooldown_reduction(user)
+        exempt = not self.get_permitted_role_ids(user.guild).isdisjoint(
+            member_role_ids(user)
+        )
         embed = discord.Embed(title=f"Debug: {user.name}", color=discord.Color.blue())
-        embed.add_field(name="User ID", value=user_id)
+        embed.add_field(name="User ID", value=str(user.id))
+        embed.add_field(name="Highest Level Role", value=str(level))
+        embed.add_field(name="Cooldown Reduction", value=f"{reduce_by} minutes")
+        embed.add_field(name="Permitted Role", value="Yes" if exempt else "No")
 
+        cooldowns = await self.bot.get_cog("Database").get_cooldowns_for_user(user.id)
+        now = datetime.datetime.now(datetime.timezone.utc)
         for channel_id, cooldown_duration in self.cooldown_channels.items():
             channel = self.bot.get_channel(int(channel_id))
-            if not channel:
-                embed.add_field(
-                    name=f"Channel {channel_id} (Not Found)",
-                    value="Channel not found.",
-                    inline=False,
+            name = f"Channel: {channel.name}" if channel else f"Channel {channel_id} (Not Found)"
+            cooldown_end_time = cooldowns.get(int(channel_id))
+            if cooldown_end_time is None:
+                status = "No active cooldown."
+            else:
+                remaining_time = (cooldown_end_time - now).total_seconds() / 60
+                status = (
+                    f"Cooldown Ends: {discord.utils.format_dt(cooldown_end_time, 'F')}\n"
+                    f"Remaining Cooldown: {remaining_time:.2f} minutes"
                 )
-                continue
-
-            last_message_time = await self.check_cache(user, channel_id)
-
-            if last_message_time is None:
-                last_message = await self.get_last_message_in_channel(user, 0, channel)
-                if last_message:
-                    last_message_time = last_message.created_at
-                    # Update the cache with the fetched last_message_time
-                    if user_id not in self.cooldown_cache:
-                        self.cooldown_cache[user_id] = {}
-                    self.cooldown_cache[user_id][channel_id] = last_message_time
-                else:
-                    embed.add_field(
-                        name=channel.name,
-                        value=f"No messages found from {user.mention} in this channel.",
-                        inline=False,
-                    )
-                    continue
-
-            now = datetime.datetime.now(datetime.timezone.utc)
-            time_diff = (now - last_message_time).total_seconds() / 60
-            remaining_time = max(0, cooldown_duration - time_diff)
-
             embed.add_field(
-                name=f"Channel: {channel.name}",
-                value=f"Last Message: {discord.utils.format_dt(last_message_time, 'F')}\n"
-                f"Time Since Last Message: {time_diff:.2f} minutes\n"
-                f"Remaining Cooldown: {remaining_time:.2f} minutes",
+                name=name,
+                value=f"Configured Cooldown: {cooldown_duration} minutes "
+                f"({cooldown_duration - reduce_by} after reduction)\n{status}",
                 inline=False,
             )
 
@@ -484,7 +579,7 @@ class cooldown(commands.Cog):
 
                 # Update the cooldown_channels variable
                 self.bot.reload_config()
-                self.cooldown_channels = self.bot.config["cooldown_channels"]
+                self._compile_message_filters()
 
                 await ctx.send(
                     f":white_check_mark: Added {channel.mention} to the cooldown channel list with a cooldown of {cooldown_time} minutes."
@@ -523,7 +618,9 @@ class cooldown(commands.Cog):
 
                 # Update the cooldown_channels variable
                 self.bot.reload_config()
-                self.cooldown_channels = self.bot.config["cooldown_channels"]
+                self._compile_message_filters()
+                # Cooldowns left in the channel would never be checked again
+                await self.bot.get_cog("Database").reset_channel_cooldowns(channel.id)
 
                 await ctx.send(
                     f":white_check_mark: Removed {channel.mention} from the cooldown channel list."
@@ -591,7 +688,7 @@ class cooldown(commands.Cog):
                     json.dump(config, f, indent=4)
 
                 self.bot.reload_config()
-                self.permitted_roles = self.bot.config["permitted_roles"]
+                self._compile_message_filters()
                 await ctx.send(
                     f":white_check_mark: Added the role `{role.name}` to the permitted roles list."
                 )
@@ -627,7 +724,7 @@ class cooldown(commands.Cog):
                     json.dump(config, f, indent=4)
 
                 self.bot.reload_config()
-                permitted_roles = self.bot.config["permitted_roles"]
+                self._compile_message_filters()
                 await ctx.send(
                     f":white_check_mark: Removed the role `{role.name}` from the permitted roles list."
                 )
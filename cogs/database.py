@@ -1,50 +1,254 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import csv
 import datetime
+import functools
+import os
+import time
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import sqlite3
+from .utils import backup, bulk, checks, levels
+from .utils.backends import create_backend
+from .utils.cooldown_cache import CooldownCache
+from .utils.leaderboard import Leaderboard
+from .utils.minecraft_links import MinecraftLinks
+from .utils.query_stats import QueryStats
+from .utils.transactions import transaction
+
+
+class Transaction:
+    """
+    A unit of work opened with ``Database.transaction()``.
+
+    Every statement runs on the Database worker thread inside one
+    ``BEGIN IMMEDIATE`` ... ``COMMIT``, so a logical operation costs a single
+    commit no matter how many rows it touches.
+    """
+
+    def __init__(self, database):
+        self._database = database
+
+    async def execute(self, query, params=None):
+        """Executes a statement and returns the number of affected rows."""
+
+        def _execute(conn):
+            return conn.execute(query, params or ()).rowcount
+
+        return await self._database._submit(_execute)
+
+    async def executemany(self, query, seq_of_params):
+        """Executes a statement once per parameter tuple and returns the row count."""
+
+        def _executemany(conn):
+            return conn.executemany(query, seq_of_params).rowcount
+
+        return await self._database._submit(_executemany)
+
+    async def fetchone(self, query, params=None):
+        """Executes a query and returns its first row, or None."""
+
+        def _fetchone(conn):
+            return conn.execute(query, params or ()).fetchone()
+
+        return await self._database._submit(_fetchone)
+
+    async def fetchall(self, query, params=None):
+        """Executes a query and returns all rows."""
+
+        def _fetchall(conn):
+            return conn.execute(query, params or ()).fetchall()
+
+        return await self._database._submit(_fetchall)
 
 
 class Database(commands.Cog):
     """
-    A cog for managing the SQLite database.
+    A cog for managing the bot's database.
+
+    Storage is delegated to a backend picked by the ``db_backend`` config
+    key (see ``cogs/utils/backends.py``). The backend is only ever touched by
+    one dedicated worker thread. Every query is handed to that thread, so the
+    event loop never blocks on disk I/O.
     """
 
     def __init__(self, bot):
         self.bot = bot
-        self.db_path = "database.db"  # Path to your database file
+        self.db_path = bot.config.get("db_path", "database.db")
         self.permitted_roles = bot.config.get("permitted_roles")
-        self.create_table()
+        self.bypass_cog_check = ["rank"]  # Open to everyone, not just permitted roles
+        levels.configure(bot.config.get("xp_curve"))
+        self._recompute_task = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database"
+        )
+        self.backend = None  # Created by cog_load, on the worker thread
+        self._conn = None
+        self.query_stats = None
+        self._lock = asyncio.Lock()  # Held for single queries and whole transactions
+        self.cooldown_cache = CooldownCache()
+        self.minecraft_links = MinecraftLinks()
+        self.leaderboard = Leaderboard(size=100)
+        self._xp_buffer = {}  # user_id -> {reason: XP granted since the last flush}
+        self._flushing = {}  # The batch flush_xp is writing, until apply_xp returns
+        self._flush_lock = asyncio.Lock()  # One flush at a time, so there's one batch in flight
+        self.backup_dir = bot.config.get("db_backup_dir", "backups")
+        # Backups get their own thread, so queries never wait on them
+        self._backup_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database-backup"
+        )
+        self._backup_lock = asyncio.Lock()
+
+    async def cog_load(self):
+        """
+        Opens and migrates the database and fills the caches on the worker
+        thread, then starts the background loops.
+
+        The levels are recomputed if the XP curve was changed while the bot
+        was offline.
+        """
+        loop = asyncio.get_running_loop()
+        self.backend = await loop.run_in_executor(
+            self._executor,
+            create_backend,
+            self.bot.config.get("db_backend", "sqlite"),
+            self.db_path,
+        )
+        self._conn = self.backend.connection  # None for non-SQLite backends
+        self.query_stats = getattr(self._conn, "stats", None) or QueryStats()
+        self.query_stats.slow_query_ms = self.bot.config.get("db_slow_query_ms", 100)
+        await loop.run_in_executor(self._executor, self._load_cooldown_cache)
+        await loop.run_in_executor(self._executor, self._load_minecraft_links)
+
+        self.flush_xp_loop.change_interval(
+            seconds=self.bot.config.get("xp_flush_seconds", 30)
+        )
+        self.flush_xp_loop.start()
+        self.snapshot_xp_loop.change_interval(
+            minutes=self.bot.config.get("xp_snapshot_minutes", 10)
+        )
+        self.snapshot_xp_loop.start()
+        if self.backend.name == "sqlite":
+            self.backup_loop.change_interval(
+                hours=self.bot.config.get("db_backup_hours", 24)
+            )
+            self.backup_loop.start()
+
+        stored_curve = await self._call(self.backend.get_level_curve)
+        if stored_curve != levels.current_curve():
+            print(
+                f"Stored levels use the XP curve {list(stored_curve)}, not "
+                f"{list(levels.current_curve())}; recomputing levels."
+            )
+            self._schedule_recompute()
 
     def cog_check(self, ctx):  # Use cog_check for the permission check
         """
-        A local check that applies to all commands in this cog.
+        A local check that applies to all commands in this cog, except the
+        ones in ``bypass_cog_check``.
         """
+        if ctx.command.qualified_name in self.bypass_cog_check:
+            return True
         return commands.has_any_role(*self.permitted_roles).predicate(ctx)
 
-    def create_table(self):
-        """Creates the cooldowns table if it doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cooldowns (
-                user_id TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                cooldown_end_time TEXT NOT NULL,
-                PRIMARY KEY (user_id, channel_id)
+    async def cog_unload(self):
+        """Flushes buffered XP, then closes the connection and stops the worker thread."""
+        self.flush_xp_loop.cancel()
+        self.snapshot_xp_loop.cancel()
+        self.backup_loop.cancel()
+        if self._recompute_task is not None:
+            self._recompute_task.cancel()
+        await self.flush_xp()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown(wait=False)
+        self._backup_executor.shutdown(wait=False)
+
+    async def _call(self, method, *args):
+        """Runs a backend method on the worker thread, after any open transaction."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(method, *args)
             )
-        """
-        )
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS minecraft_users (
-                discord_user_id INT NOT NULL,
-                minecraft_username TEXT NOT NULL,
-                PRIMARY KEY (discord_user_id)
-            )"""
+
+    async def _submit(self, func, *args):
+        """Runs ``func(conn, *args)`` on the worker thread and awaits the result."""
+        if self._conn is None:
+            raise RuntimeError(
+                f"Raw SQL needs a SQLite backend, not {self.backend.name!r}"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, self._conn, *args)
         )
-        conn.commit()
-        conn.close()
+
+    async def _run(self, func, *args):
+        """Like ``_submit``, but waits for any open transaction to finish first."""
+        async with self._lock:
+            return await self._submit(func, *args)
+
+    async def _run_in_transaction(self, func, *args):
+        """Runs ``func(conn, *args)`` inside one transaction in a single worker hop."""
+
+        def _transaction(conn, *args):
+            with transaction(conn):
+                return func(conn, *args)
+
+        return await self._run(_transaction, *args)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        Opens a unit of work on the shared connection.
+
+        Everything executed through the yielded ``Transaction`` is committed
+        once when the block exits, or rolled back if it raises. Other queries
+        wait until the transaction is finished.
+
+        Examples:
+            async with db.transaction() as tx:
+                await tx.executemany(query, rows)
+        """
+        async with self._lock:
+            await self._submit(lambda conn: conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield Transaction(self)
+            except BaseException:
+                await self._submit(lambda conn: conn.execute("ROLLBACK"))
+                raise
+            await self._submit(lambda conn: conn.execute("COMMIT"))
+
+    def _load_cooldown_cache(self):
+        """Fills the cooldown cache with every cooldown that is still active."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        rows = self.backend.active_cooldowns(int(now.timestamp()))
+        for user_id, channel_id, cooldown_end_time in rows:
+            self.cooldown_cache.set(
+                user_id,
+                channel_id,
+                datetime.datetime.fromtimestamp(
+                    cooldown_end_time, datetime.timezone.utc
+                ),
+                now,
+            )
+
+    def _load_minecraft_links(self):
+        """Fills the Minecraft link map from the database."""
+        self.minecraft_links.load(self.backend.all_minecraft_users())
+
+    @staticmethod
+    def _execute(conn, query, params=None, fetch=False):
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        if fetch:
+            return cursor.fetchall()
+        return None
 
     async def run_query(self, query, params=None, fetch=False):
         """Runs a SQL query against the database.
@@ -56,74 +260,54 @@ class Database(commands.Cog):
 
         Returns:
             list or None: The query results if fetch is True, otherwise None.
+
+        Large result sets should use ``stream`` instead, which doesn't load
+        every row into memory at once.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-
-            conn.commit()
-            if fetch:
-                return cursor.fetchall()
-            else:
-                return None
-
+            return await self._run(self._execute, query, params, fetch)
         except Exception as e:
             print(f"Error running query: {e}")
             raise  # Re-raise the exception after logging
-        finally:
-            if conn:
-                conn.close()
 
-    async def insert_cooldown(self, user_id, channel_id, cooldown_expiry):
-        """Inserts or updates the cooldown for a user in a channel."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO cooldowns (user_id, channel_id, cooldown_end_time)
-                VALUES (?, ?, ?)
-            """,
-                (user_id, channel_id, cooldown_expiry.isoformat()),
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Error inserting cooldown into database: {e}")
+    async def stream(self, query, params=None, chunk_size=1000):
+        """
+        Runs a query and yields its rows in chunks instead of all at once.
 
-    async def get_cooldown(self, user_id, channel_id):
-        """Retrieves the cooldown end time for a user in a channel."""
+        Each chunk is a separate ``fetchmany`` on the worker thread, and other
+        queries get their turn in between, so a scan over a whole table runs
+        in constant memory without holding up the rest of the bot.
+
+        Args:
+            query: The SQL query to be executed.
+            params: The parameters to be used with the query.
+            chunk_size: How many rows to fetch per chunk.
+
+        Yields:
+            Lists of up to ``chunk_size`` rows.
+
+        Examples:
+            async for rows in db.stream("SELECT user_id, experience FROM experience"):
+                ...
+        """
+        cursor = await self._run(lambda conn: conn.execute(query, params or ()))
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT cooldown_end_time FROM cooldowns
-                WHERE user_id = ? AND channel_id = ?
-            """,
-                (user_id, channel_id),
-            )
-            result = cursor.fetchone()
-            conn.close()
-            return datetime.datetime.fromisoformat(result[0]) if result else None
-        except Exception as e:
-            print(f"Error retrieving cooldown from database: {e}")
-            return None
+            while rows := await self._run(lambda conn: cursor.fetchmany(chunk_size)):
+                yield rows
+        finally:
+            await self._run(lambda conn: cursor.close())
 
     async def get_user_level_and_xp_to_next(self, user: discord.Member):
         """
         Retrieves a user's current experience points and level, and calculates the experience needed to reach the next level.
         If the user does not exist in the database, they are added with zero experience and level.
+        XP that is still waiting in the write-behind buffer is included.
 
         Args:
             user: The Discord member whose experience and level information is to be retrieved.
 
         Returns:
-            A tuple containing the user's current experience, level, and the experience points needed to reach the next level.
+            A tuple containing the user's experience within their current level, their level, and the experience points needed to reach the next level.
 
         Raises:
             Exception: If there is an error during the database operation.
@@ -132,277 +316,672 @@ class Database(commands.Cog):
             xp, level, xp_to_next = await get_user_level_and_xp_to_next(user)
         """
 
-        user_id = user.id
-
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT experience FROM experience
-                WHERE user_id = ?
-                """,
-                (user_id,),
-            )
-            result = cursor.fetchone()
-
-            if not result:
-                # User not found, add them with 0 experience
-                cursor.execute(
-                    """
-                    INSERT INTO experience (user_id, experience, level)
-                    VALUES (?, 0, 0)
-                    """,
-                    (user_id,),
-                )
-                conn.commit()
-                return 0, 0, 100  # Return 0 XP, 0 level, and 100 XP to next level
-
-            xp = result[0]
-            lvl = 0
-            xp_needed = 5 * (lvl**2) + (50 * lvl) + 100  # XP needed for the next level
-
-            while xp >= xp_needed:
-                xp -= xp_needed  # Subtract XP needed for the current level
-                lvl += 1
-                xp_needed = 5 * (lvl**2) + (50 * lvl) + 100  # Calculate for next level
-
-            xp_to_next_level = xp_needed - xp  # Remaining XP to next level
-
-            return xp, lvl, xp_to_next_level
-
+            total_xp = await self._call(self.backend.get_or_create_experience, user.id)
+            if total_xp is None:
+                self.leaderboard.update(user.id, 0, 0)
+                total_xp = 0
+            return levels.level_progress(total_xp + self._pending_xp(user.id))
         except Exception as e:
             print(f"Error calculating level and XP to next level: {e}")
             return None
 
-        finally:
-            if conn:
-                conn.close()
-
     async def insert_cooldown(self, user_id, channel_id, cooldown_expiry):
         """Inserts or updates the cooldown for a user in a channel."""
-        await self.run_query(
-            """
-            INSERT OR REPLACE INTO cooldowns (user_id, channel_id, cooldown_end_time)
-            VALUES (?, ?, ?)
-            """,
-            (user_id, channel_id, cooldown_expiry.isoformat()),
+        await self.insert_cooldowns(user_id, {channel_id: cooldown_expiry})
+
+    async def insert_cooldowns(self, user_id, cooldowns):
+        """
+        Inserts or updates a user's cooldowns for several channels in one commit.
+
+        Args:
+            user_id: The ID of the user the cooldowns apply to.
+            cooldowns: A mapping of channel ID to cooldown expiry datetime.
+        """
+        user_id = int(user_id)
+        await self._call(
+            self.backend.set_cooldowns,
+            user_id,
+            {
+                int(channel_id): int(cooldown_expiry.timestamp())
+                for channel_id, cooldown_expiry in cooldowns.items()
+            },
         )
+        for channel_id, cooldown_expiry in cooldowns.items():
+            self.cooldown_cache.set(user_id, int(channel_id), cooldown_expiry)
 
     async def get_cooldown(self, user_id, channel_id):
-        """Retrieves the cooldown end time for a user in a channel."""
-        result = await self.run_query(
-            """
-            SELECT cooldown_end_time FROM cooldowns
-            WHERE user_id = ? AND channel_id = ?
-            """,
-            (user_id, channel_id),
-            fetch=True,  # Fetch the result
-        )
+        """
+        Retrieves the cooldown end time for a user in a channel.
 
-        if result and result[0]:  # Added error handling for no return
-            return datetime.datetime.fromisoformat(result[0][0])
-        return None
+        Served from the in-memory cooldown cache, which is loaded from the
+        database at startup and written through by ``insert_cooldown(s)``.
+        Returns None if the user has no active cooldown in the channel.
+        """
+        return self.cooldown_cache.get(int(user_id), int(channel_id))
+
+    async def get_cooldowns_for_user(self, user_id):
+        """
+        Retrieves every active cooldown a user has, in one cache lookup.
+
+        Returns:
+            A dict of channel ID (int) to cooldown end time. Channels where
+            the user has no active cooldown are left out.
+        """
+        return self.cooldown_cache.get_user(int(user_id))
+
+    async def reset_cooldowns(self, user_id, channel_id=None):
+        """
+        Clears a user's cooldown in one channel, or in every channel.
+
+        Args:
+            user_id: The ID of the user whose cooldowns are cleared.
+            channel_id: The channel to clear, or None for every channel.
+
+        Returns:
+            The number of cooldowns deleted.
+        """
+        user_id = int(user_id)
+        channel_id = None if channel_id is None else int(channel_id)
+        deleted = await self._call(self.backend.delete_cooldowns, user_id, channel_id)
+        self.cooldown_cache.discard(user_id, channel_id)
+        return deleted
+
+    async def reset_channel_cooldowns(self, channel_id):
+        """
+        Clears every user's cooldown in a channel.
+
+        Returns:
+            The number of cooldowns deleted.
+        """
+        channel_id = int(channel_id)
+        deleted = await self._call(self.backend.delete_channel_cooldowns, channel_id)
+        self.cooldown_cache.discard_channel(channel_id)
+        return deleted
+
+    async def purge_expired_cooldowns(self, batch_size=500):
+        """
+        Deletes expired rows from the cooldowns table in small batches.
+
+        Each batch is its own short write, and other queries get a turn
+        between batches, so the sweep never holds the write lock for long.
+
+        Args:
+            batch_size: The maximum number of rows deleted per batch.
+
+        Returns:
+            The total number of rows deleted.
+        """
+
+        now = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        reclaimed = 0
+        while True:
+            deleted = await self._call(
+                self.backend.purge_expired_cooldowns, now, batch_size
+            )
+            reclaimed += deleted
+            if deleted < batch_size:
+                return reclaimed
+            await asyncio.sleep(0)  # Let queued cooldown checks run between batches
 
     async def add_minecraft_user(self, discord_user_id, minecraft_username):
-        """Adds a Minecraft user to the database."""
+        """
+        Links a Discord user to a Minecraft name.
 
-        if self.get_minecraft_user(discord_user_id):
+        Returns:
+            False if the user or the name (in any case) is already linked.
+        """
+        discord_user_id = int(discord_user_id)
+        if (
+            self.minecraft_links.get_username(discord_user_id) is not None
+            or self.minecraft_links.get_user_id(minecraft_username) is not None
+        ):
             return False
-
-        await self.run_query(
-            """
-            INSERT INTO minecraft_users (discord_user_id, minecraft_username)
-            VALUES (?, ?)
-            """,
-            (discord_user_id, minecraft_username),
+        added = await self._call(
+            self.backend.add_minecraft_user, discord_user_id, minecraft_username
         )
-        return True
+        if added:
+            self.minecraft_links.add(discord_user_id, minecraft_username)
+        return added
 
     async def get_minecraft_user(self, discord_user_id):
-        """Retrieves a Minecraft user from the database."""
-        result = await self.run_query(
-            """
-            SELECT minecraft_username FROM minecraft_users
-            WHERE discord_user_id = ?
-            """,
-            (discord_user_id,),
-            fetch=True,
-        )
+        """Returns the Minecraft name linked to a Discord user, or None."""
+        return self.minecraft_links.get_username(int(discord_user_id))
 
-        if result and result[0]:
-            return result[0][0]
-        return None
+    async def get_discord_user(self, minecraft_username):
+        """Returns the ID of the Discord user linked to a Minecraft name, or None."""
+        return self.minecraft_links.get_user_id(minecraft_username)
 
     async def remove_minecraft_user(self, user_input):
-        """Removes a Minecraft user from the database."""
-
-        if user_input.isdigit():
-            discord_user_id = int(input)
-            if not self.get_minecraft_user(discord_user_id):
-                return False
-            await self.run_query(
-                """
-                    DELETE FROM minecraft_users
-                    WHERE discord_user_id = ?
-                    """,
-                (discord_user_id,),
-            )
+        """
+        Unlinks a Minecraft user.
+
+        Args:
+            user_input: A Discord user ID or a Minecraft name.
 
+        Returns:
+            True if a link was removed.
+        """
+        user_input = str(user_input)
+        if user_input.isdigit() and self.minecraft_links.get_username(int(user_input)):
+            discord_user_id = int(user_input)
         else:
-            minecraft_username = user_input
-            result = await self.run_query(
-                """
-                SELECT discord_user_id FROM minecraft_users
-                WHERE minecraft_username = ?
-                """,
-                (minecraft_username,),
-            )
-            if not result or not result[0]:
-                return False
-            discord_user_id = result[0]
-            if not self.get_minecraft_user(discord_user_id):
-                return False
-            await self.run_query(
-                """
-                        DELETE FROM minecraft_users
-                        WHERE discord_user_id = ?
-                        """,
-                (discord_user_id,),
-            )
+            # Minecraft names can be all digits too
+            discord_user_id = self.minecraft_links.get_user_id(user_input)
+        if discord_user_id is None:
+            return False
+        removed = await self._call(
+            self.backend.remove_minecraft_user, discord_user_id, None
+        )
+        self.minecraft_links.remove(discord_user_id)
+        return removed
 
-        return True
+    def _pending_xp(self, user_id):
+        """
+        Returns the XP granted to a user that isn't in the database yet,
+        including the batch a running flush is still writing.
+        """
+        return sum(self._xp_buffer.get(user_id, {}).values()) + sum(
+            self._flushing.get(user_id, {}).values()
+        )
 
-    async def add_xp(self, user_id, experience_to_give):
+    async def add_xp(self, user_id, experience_to_give, reason=None):
         """
         Adds experience points to a user's record in the database and updates their level if necessary.
-        This function handles both existing users by updating their experience and level, and new users by initializing their records.
+
+        Grants are buffered in memory and appended to the XP ledger by
+        ``flush_xp``, which runs periodically and when the cog is unloaded.
+        Any number of grants between two flushes costs a single commit.
 
         Args:
             user_id: The ID of the user to whom experience points will be added.
             experience_to_give: The amount of experience points to add to the user's record.
+            reason: Why the XP was granted, recorded in the ledger.
 
         Returns:
             None
 
-        Raises:
-            Exception: If there is an error during the database operation.
-
         Examples:
             await add_xp(user_id=12345, experience_to_give=50)
         """
+        reasons = self._xp_buffer.setdefault(user_id, {})
+        reasons[reason] = reasons.get(reason, 0) + experience_to_give
 
+    async def flush_xp(self):
+        """
+        Appends all buffered XP grants to the XP ledger in one transaction.
+
+        Returns:
+            The number of users whose experience was updated.
+        """
+        async with self._flush_lock:
+            if not self._xp_buffer:
+                return 0
+            # Reads keep counting the batch through _flushing until it's written
+            self._flushing, self._xp_buffer = self._xp_buffer, {}
+            grants = [
+                (user_id, delta, reason)
+                for user_id, reasons in self._flushing.items()
+                for reason, delta in reasons.items()
+            ]
+
+            try:
+                totals = await self._call(self.backend.apply_xp, grants)
+            except Exception as e:
+                print(f"Error flushing XP to database: {e}")
+                # Put the grants back so the next flush retries them
+                for user_id, delta, reason in grants:
+                    reasons = self._xp_buffer.setdefault(user_id, {})
+                    reasons[reason] = reasons.get(reason, 0) + delta
+                return 0
+            finally:
+                self._flushing = {}
+
+            for user_id, new_xp, new_level in totals:
+                self.leaderboard.update(user_id, new_xp, new_level)
+            return len(totals)
+
+    @tasks.loop(seconds=30)
+    async def flush_xp_loop(self):
+        await self.flush_xp()
+
+    @tasks.loop(minutes=10)
+    async def snapshot_xp_loop(self):
+        """Folds the XP ledger into per-user totals so level reads stay short."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            await self._call(self.backend.snapshot_experience)
+        except Exception as e:
+            print(f"Error snapshotting XP ledger: {e}")
 
-            # Get the user's current experience and level
-            cursor.execute(
-                "SELECT experience, level FROM experience WHERE user_id = ?", (user_id,)
-            )
-            result = cursor.fetchone()
-
-            if result:
-                current_xp, current_level = result
-                new_xp = current_xp + experience_to_give
-
-                # Calculate the new level
-                new_level = current_level
-                xp_needed = 5 * (new_level**2) + (50 * new_level) + 100
-
-                while new_xp >= xp_needed:
-                    new_xp -= xp_needed
-                    new_level += 1
-                    xp_needed = 5 * (new_level**2) + (50 * new_level) + 100
-
-                # Update the user's experience and level if it changed
-                if new_level != current_level:
-                    cursor.execute(
-                        "UPDATE experience SET experience = ?, level = ? WHERE user_id = ?",
-                        (new_xp, new_level, user_id),
-                    )
-                else:
-                    cursor.execute(
-                        "UPDATE experience SET experience = ? WHERE user_id = ?",
-                        (new_xp, user_id),
-                    )
-            else:
-                # If the user doesn't exist, add them to the database
-                new_level = 0
-                xp_needed = 5 * (new_level**2) + (50 * new_level) + 100
-                while experience_to_give >= xp_needed:
-                    experience_to_give -= xp_needed
-                    new_level += 1
-                    xp_needed = 5 * (new_level**2) + (50 * new_level) + 100
-
-                cursor.execute(
-                    """
-                    INSERT INTO experience (user_id, experience, level) 
-                    VALUES (?, ?, ?)
-                    """,
-                    (user_id, experience_to_give, new_level),
-                )
+    async def get_leaderboard(self, limit=100):
+        """
+        Retrieves the top users from the database based on their level.
+
+        Served from the in-memory leaderboard, which ``add_xp`` and
+        ``reset_user_xp_level`` keep up to date. It is only reloaded from the
+        database when resets have pushed it below its size.
+
+        Args:
+            limit: How many users to return, at most 100.
 
-            conn.commit()
+        Returns:
+            A list of lists, where each inner list contains the user_id and level
+            of a user, sorted in descending order by level, then experience.
+            Returns None if there is an error.
+        """
+        try:
+            await self.flush_xp()
+            if self.leaderboard.stale:
+                rows = await self._call(
+                    self.backend.top_experience, self.leaderboard.capacity
+                )
+                self.leaderboard.load(rows)
 
+            return self.leaderboard.top(limit)
         except Exception as e:
-            print(f"Error adding XP to database: {e}")
+            print(f"Error retrieving leaderboard from database: {e}")
+            return None
 
-        finally:
-            if conn:
-                conn.close()
+    async def backup_database(self):
+        """
+        Takes an online backup of the database file into ``backup_dir``.
+
+        The copy runs on its own thread from a pinned read snapshot, so
+        queries and cooldown checks carry on while it runs. Only the newest
+        ``db_backup_keep`` snapshots are kept.
+
+        Returns:
+            The path of the new snapshot.
+
+        Raises:
+            RuntimeError: If the backend isn't a SQLite file, or a backup
+                is already running.
+        """
+        if self.backend.name != "sqlite":
+            raise RuntimeError(
+                f"Backups need the sqlite backend, not {self.backend.name!r}"
+            )
+        if self._backup_lock.locked():
+            raise RuntimeError("A backup is already running")
+        async with self._backup_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._backup_executor,
+                functools.partial(
+                    backup.backup_database,
+                    self.db_path,
+                    self.backup_dir,
+                    keep=self.bot.config.get("db_backup_keep", 7),
+                ),
+            )
+
+    @tasks.loop(hours=24)
+    async def backup_loop(self):
+        """Backs up the database on a schedule."""
+        # Skip the backup on startup if a recent one already exists
+        backups = backup.list_backups(self.backup_dir, self.db_path)
+        age = datetime.datetime.now().timestamp() - backups[0][2] if backups else None
+        if age is not None and age < self.backup_loop.hours * 3600 / 2:
+            return
+        try:
+            path = await self.backup_database()
+            print(f"Database backed up to {path}")
+        except Exception as e:
+            print(f"Error backing up database: {e}")
 
-    async def get_leaderboard(self):
+    async def get_rank(self, user_id, k=2):
         """
-        Retrieves the top 100 users from the database based on their level.
+        Retrieves a user's leaderboard position and the users around them.
+
+        The position is an indexed count over (level, experience), so it
+        doesn't need the whole leaderboard.
+
+        Args:
+            user_id: The ID of the user to rank.
+            k: How many users to include above and below the user.
 
         Returns:
-            A list of lists, where each inner list contains the user_id and level
-            of a user, sorted in descending order by level.
-            Returns None if there is an error.
+            A tuple of the user's rank (starting at 1) and a list of
+            (rank, user_id, level, experience) for the users around them,
+            best first. Returns None if the user has no experience record
+            or there is an error.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT user_id, level FROM experience
-                ORDER BY level DESC
-                LIMIT 100
-                """
+            await self.flush_xp()
+            result = await self._call(self.backend.experience_rank, int(user_id), k)
+            if result is None:
+                return None
+            rank, rows = result
+            first = rank - next(
+                i for i, row in enumerate(rows) if row[0] == int(user_id)
             )
-            result = cursor.fetchall()
-
-            return [[row[0], row[1]] for row in result]
+            return rank, [
+                (first + i, row_user_id, level, experience)
+                for i, (row_user_id, experience, level) in enumerate(rows)
+            ]
         except Exception as e:
-            print(f"Error retrieving leaderboard from database: {e}")
+            print(f"Error retrieving rank from database: {e}")
             return None
 
+    @commands.command()
+    async def rank(self, ctx, member: discord.Member = None):
+        """Shows a member's leaderboard rank and the members around them."""
+        member = member or ctx.author
+        result = await self.get_rank(member.id)
+        if result is None:
+            embed = discord.Embed(
+                title="Error",
+                description=f"{member.mention} doesn't have any XP yet.",
+                color=discord.Color.red(),
+            )
+            await ctx.send(embed=embed)
+            return
+
+        rank, rows = result
+        lines = []
+        for position, user_id, level, experience in rows:
+            line = f"`#{position}` <@{user_id}> - Level {level} ({experience} XP)"
+            lines.append(f"**{line}**" if user_id == member.id else line)
+        embed = discord.Embed(
+            title=f"{member.display_name} is rank #{rank}",
+            description="\n".join(lines),
+            color=discord.Color.blue(),
+        )
+        await ctx.send(embed=embed)
+
+    async def recompute_levels(self, chunk_size=50000):
+        """
+        Recomputes every user's level from their XP, e.g. after the XP curve
+        changes.
+
+        Users are processed in chunks, each computed in bulk and written in
+        its own transaction, with other queries running in between. Once
+        every chunk is done, the curve is recorded in the database, so a
+        restart knows the stored levels match it.
+
+        Args:
+            chunk_size: How many users are read and written per chunk.
+
+        Returns:
+            A tuple of the number of users checked and the number updated.
+        """
+        curve = levels.current_curve()
+        await self.flush_xp()
+        await self._call(self.backend.snapshot_experience)
+        checked = updated = 0
+        last_user_id = -1
+        try:
+            while True:
+                last_user_id, chunk_checked, chunk_updated = await self._call(
+                    self.backend.recompute_levels, last_user_id, chunk_size
+                )
+                if last_user_id is None:
+                    await self._call(self.backend.set_level_curve, curve)
+                    return checked, updated
+                checked += chunk_checked
+                updated += chunk_updated
         finally:
-            if conn:
-                conn.close()
+            self.leaderboard.stale = True
+
+    @commands.Cog.listener()
+    async def on_config_reload(self):
+        """
+        Switches to the configured XP curve. If it changed, every stored
+        level is recomputed in the background.
+        """
+        try:
+            changed = levels.configure(self.bot.config.get("xp_curve"))
+        except ValueError as e:
+            print(f"Keeping the old XP curve: {e}")
+            return
+        if changed:
+            print(f"XP curve changed to {list(levels.current_curve())}; recomputing levels.")
+            self._schedule_recompute()
+
+    def _schedule_recompute(self):
+        """Recomputes every level in the background, after any recompute already running."""
+        self._recompute_task = asyncio.create_task(
+            self._recompute_after_curve_change(self._recompute_task)
+        )
+
+    async def _recompute_after_curve_change(self, previous):
+        if previous is not None:
+            with contextlib.suppress(Exception):
+                await previous  # Let a recompute that's still running finish
+        try:
+            checked, updated = await self.recompute_levels()
+            print(f"Recomputed levels: checked {checked} users, updated {updated}.")
+        except Exception as e:
+            print(f"Error recomputing levels: {e}")
 
     async def reset_user_xp_level(self, user_id):
+        self._xp_buffer.pop(user_id, None)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                UPDATE experience 
-                SET experience = 0, level = 0 
-                WHERE user_id = ?
-                """,
-                (user_id,),
-            )
-            conn.commit()
+            reset = await self._call(self.backend.reset_experience, user_id)
+            if reset:
+                self.leaderboard.update(user_id, 0, 0)
             return True
 
         except Exception as e:
             print(f"Error resetting user level and experience: {e}")
             return False
+
+    @commands.group(name="db", invoke_without_command=True)
+    @checks.is_donald()
+    async def db(self, ctx):
+        """Database maintenance commands."""
+        await ctx.send_help(ctx.command)
+
+    @db.command(name="export")
+    async def db_export(self, ctx, table: str, fmt: str = "csv"):
+        """
+        Exports a table as a CSV or JSONL file.
+
+        Tables: experience, minecraft_users. Formats: csv, jsonl.
+        Rows are streamed from a cursor in chunks, so memory use stays flat.
+        """
+        if table not in bulk.TABLES or fmt not in bulk.FORMATS:
+            return await ctx.send(
+                embed=discord.Embed(
+                    title="Error",
+                    description=f"Table must be one of {', '.join(bulk.TABLES)} and format one of {', '.join(bulk.FORMATS)}.",
+                    color=discord.Color.red(),
+                )
+            )
+
+        if table == "experience":
+            await self.flush_xp()
+            await self._call(self.backend.snapshot_experience)
+
+        path = f"{table}.{fmt}"
+        exported = 0
+        try:
+            with open(path, "w", newline="", encoding="utf-8") as fp:
+                writer = bulk.RowWriter(fp, fmt, table)
+                async for rows in self.stream(bulk.export_query(table), chunk_size=5000):
+                    writer.write(rows)
+                    exported += len(rows)
+
+            await ctx.send(
+                embed=discord.Embed(
+                    title="Success",
+                    description=f"Exported {exported} rows from `{table}`.",
+                    color=discord.Color.green(),
+                ),
+                file=discord.File(path),
+            )
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @db.command(name="stats")
+    async def db_stats(self, ctx, count: int = 10):
+        """Shows the statements that have spent the most time in the database."""
+        embed = discord.Embed(title="Query Stats", color=discord.Color.blue())
+        for sql, stats in self.query_stats.top(min(count, 25)):
+            embed.add_field(
+                name=f"{stats.total_ms:.1f} ms total over {stats.calls} calls",
+                value=f"avg `{stats.total_ms / max(stats.calls, 1):.2f} ms` · "
+                f"p95 `<= {stats.percentile(0.95)} ms` · max `{stats.max_ms:.2f} ms` · "
+                f"fetch `{stats.fetch_ms:.1f} ms`\n```sql\n{sql[:900]}\n```",
+                inline=False,
+            )
+        if not embed.fields:
+            embed.description = "No queries recorded yet."
+        await ctx.send(embed=embed)
+
+    @db.command(name="slowlog")
+    async def db_slowlog(self, ctx):
+        """Shows the most recent queries slower than the slow query threshold."""
+        entries = [
+            f"{discord.utils.format_dt(datetime.datetime.fromtimestamp(ts, datetime.timezone.utc), 'T')} "
+            f"`{elapsed_ms:.1f} ms` `{sql[:150]}`"
+            for ts, sql, elapsed_ms in reversed(self.query_stats.slow_log)
+        ]
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Slow Queries (>= {self.query_stats.slow_query_ms} ms)",
+                description="\n".join(entries)[:4000] or "No slow queries recorded.",
+                color=discord.Color.orange(),
+            )
+        )
+
+    @db.command(name="resetstats")
+    async def db_resetstats(self, ctx):
+        """Clears the query stats and the slow query log."""
+        self.query_stats.reset()
+        await ctx.send(":white_check_mark: Query stats cleared.")
+
+    @db.command(name="backup")
+    async def db_backup(self, ctx):
+        """Takes a backup of the database now."""
+        try:
+            path = await self.backup_database()
+        except Exception as e:
+            print(f"Error backing up database: {e}")
+            embed = discord.Embed(
+                title="Error", description=str(e), color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            title="Success",
+            description=f"Database backed up to `{path}`.",
+            color=discord.Color.green(),
+        )
+        await ctx.send(embed=embed)
+
+    @db.command(name="backups")
+    async def db_backups(self, ctx):
+        """Lists the database backups, newest first."""
+        entries = [
+            f"`{os.path.basename(path)}` - {size / 1024 / 1024:.2f} MB, "
+            f"{discord.utils.format_dt(datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc), 'R')}"
+            for path, size, mtime in backup.list_backups(self.backup_dir, self.db_path)
+        ]
+        await ctx.send(
+            embed=discord.Embed(
+                title="Database Backups",
+                description="\n".join(entries)[:4000] or "No backups yet.",
+                color=discord.Color.blue(),
+            )
+        )
+
+    @db.command(name="recompute")
+    async def db_recompute(self, ctx):
+        """Recomputes every user's level from their XP."""
+        start = time.perf_counter()
+        try:
+            checked, updated = await self.recompute_levels()
+        except Exception as e:
+            print(f"Error recomputing levels: {e}")
+            embed = discord.Embed(
+                title="Error", description=str(e), color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            title="Success",
+            description=f"Checked {checked} users and updated {updated} levels in {time.perf_counter() - start:.2f}s.",
+            color=discord.Color.green(),
+        )
+        await ctx.send(embed=embed)
+
+    @db.command(name="import")
+    async def db_import(self, ctx, table: str):
+        """
+        Imports rows into a table from an attached CSV or JSONL file.
+
+        Existing rows with the same ID are replaced. For the experience
+        table, levels are recomputed from the imported XP totals. Rows are
+        written in chunks, with one transaction per chunk.
+        """
+        if table not in bulk.TABLES:
+            return await ctx.send(
+                embed=discord.Embed(
+                    title="Error",
+                    description=f"Table must be one of {', '.join(bulk.TABLES)}.",
+                    color=discord.Color.red(),
+                )
+            )
+        if not ctx.message.attachments:
+            return await ctx.send(
+                embed=discord.Embed(
+                    title="Error",
+                    description="No file attached.",
+                    color=discord.Color.red(),
+                )
+            )
+
+        attachment = ctx.message.attachments[0]
+        fmt = bulk.format_from_filename(attachment.filename)
+        if not fmt:
+            return await ctx.send(
+                embed=discord.Embed(
+                    title="Error",
+                    description="Please upload a `.csv` or `.jsonl` file.",
+                    color=discord.Color.red(),
+                )
+            )
+
+        if table == "experience":
+            await self.flush_xp()  # Apply pending grants before they're overwritten
+
+        path = f"{table}_import.{fmt}"
+        imported = 0
+        try:
+            await attachment.save(path)
+            with open(path, "r", newline="", encoding="utf-8") as fp:
+                for rows in bulk.chunked(bulk.read_rows(fp, fmt, table), 5000):
+                    imported += await self._run_in_transaction(
+                        bulk.import_chunk, table, rows
+                    )
+            await ctx.send(
+                embed=discord.Embed(
+                    title="Success",
+                    description=f"Imported {imported} rows into `{table}`.",
+                    color=discord.Color.green(),
+                )
+            )
+        except (KeyError, ValueError, csv.Error, sqlite3.Error) as e:
+            await ctx.send(
+                embed=discord.Embed(
+                    title="Error",
+                    description=f"Import stopped after {imported} rows: {e}",
+                    color=discord.Color.red(),
+                )
+            )
         finally:
-            if conn:
-                conn.close()
+            if table == "experience":
+                self.leaderboard.stale = True
+            elif table == "minecraft_users":
+                self.minecraft_links.load(
+                    await self._call(
+                        lambda: list(self.backend.all_minecraft_users())
+                    )
+                )
+            if os.path.exists(path):
+                os.remove(path)
 
 
 async def setup(bot):
@@ -1,9 +1,9 @@
-import contextlib
 import datetime
 import discord
 from rcon.source import Client
 from discord.ext import commands
 from .utils import checks
+from .utils.level_roles import get_level_role_index
 
 
 class rcon_client:
@@ -141,11 +141,15 @@ class Minecraft(commands.Cog):
             586928217768591370 if self.debug_mode else bot.config["main_server_id"]
         )
 
-        self.level_roles = self.get_level_roles()
+        self.level_roles = get_level_role_index(bot)
         self.required_level_to_join = self.bot.config["minecraft"][
             "required_level_to_join"
         ]
 
+    @property
+    def database(self):
+        return self.bot.get_cog("Database")
+
     async def send_log(self, title: str, description: str, color: discord.Color):
         embed = discord.Embed(
             title=title,
@@ -156,32 +160,11 @@ class Minecraft(commands.Cog):
         # Send DM with embed
         await self.log_channel.send(embed=embed)
 
-    def get_level_roles(self):
-        """
-        Gets all roles that follow the format '[Level N] Name'
-        and stores them in self.level_roles.
-        """
-        level_roles = {}
-        for role in self.main_server.roles:
-            with contextlib.suppress(IndexError, ValueError):
-                if not role.name.startswith("[Level "):
-                    continue  # Skip roles that don't match the format
-
-                level_str = role.name.split("]")[0]  # Get the part before the ']'
-                level_number = int(level_str.split("[Level ")[1])  # Extract the number
-                level_roles[level_number] = role.id
-        return level_roles
-
     def check_join_requirements(self, user: discord.Member):
         """
         Check if the user meets the required level to join the minecraft server.
         """
-        highest_level = 0
-        for role in user.roles:
-            for level_number, role_id in self.level_roles.items():
-                if role.id == role_id and level_number > highest_level:
-                    highest_level = level_number
-
+        highest_level = self.level_roles.highest_level(user, self.main_server)
         return highest_level >= self.required_level_to_join
 
     @commands.group(aliases=["mc"])
@@ -196,6 +179,20 @@ class Minecraft(commands.Cog):
     @checks.in_lc()
     async def join_command(self, ctx, minecraft_username: str):
         if self.check_join_requirements(ctx.author):
+            # Each Minecraft account can only belong to one Discord account
+            linked_user_id = await self.database.get_discord_user(minecraft_username)
+            if linked_user_id is not None and linked_user_id != ctx.author.id:
+                await ctx.send(
+                    f":no_entry: `{minecraft_username}` is already linked to another Discord account.\n-# If you think this is a mistake, please contact a Minecraft staff member."
+                )
+                return
+            linked_username = await self.database.get_minecraft_user(ctx.author.id)
+            if linked_username is not None and linked_user_id is None:
+                await ctx.send(
+                    f":no_entry: You are already linked to `{linked_username}`.\n-# Please contact a Minecraft staff member to change it."
+                )
+                return
+
             try:
                 # Create buttons
                 accept_button = discord.ui.Button(
@@ -233,6 +230,11 @@ class Minecraft(commands.Cog):
 
                         # Send DM with embed
                         await ctx.author.send(embed=embed)
+
+                        # Link the accounts; staff still whitelist the player
+                        await self.database.add_minecraft_user(
+                            ctx.author.id, minecraft_username
+                        )
                         await interaction.response.send_message(
                             "You have been sent a DM with the server information.",
                             ephemeral=True,
@@ -537,6 +539,7 @@ class Minecraft(commands.Cog):
         """Removes a user from the whitelist."""
         try:
             result = self.minecraft.whitelist_remove(username)
+            await self.database.remove_minecraft_user(username)
             await ctx.send(result)
             await self.send_log(
                 "Whitelist Remove Command",
@@ -659,10 +662,9 @@ class Minecraft(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_member_remove(self, payload):
-        user, guild_id = payload
-        if guild_id != self.main_server.id:
+        if payload.guild_id != self.main_server.id:
             return
-        user_id = user.id
+        user_id = payload.user.id
 
         # Check if user was in minecraft:
         check = await self.database.get_minecraft_user(user_id)
@@ -0,0 +1,561 @@
+import heapq
+import sqlite3
+import time
+from . import ledger, levels, migrations
+from .query_stats import TimedConnection
+from .transactions import transaction
+
+# Storage backends for the Database cog. A backend is only ever used from
+# the Database worker thread, so implementations don't need to be
+# thread-safe. Cooldown end times are epoch seconds; experience is the
+# user's total XP. XP changes are kept as an append-only ledger of
+# (user_id, delta, reason) entries.
+
+
+class StorageBackend:
+    """The operations the Database cog needs from its storage."""
+
+    name = None
+    connection = None  # A sqlite3 connection, for backends that have one
+
+    def close(self):
+        pass
+
+    # Cooldowns
+
+    def set_cooldowns(self, user_id, cooldowns):
+        """Stores ``{channel_id: end_time}`` for a user in one commit."""
+        raise NotImplementedError
+
+    def active_cooldowns(self, now):
+        """Yields (user_id, channel_id, end_time) for cooldowns ending after ``now``."""
+        raise NotImplementedError
+
+    def purge_expired_cooldowns(self, now, batch_size):
+        """Deletes up to ``batch_size`` cooldowns that ended by ``now``. Returns the count."""
+        raise NotImplementedError
+
+    def delete_cooldowns(self, user_id, channel_id=None):
+        """Deletes a user's cooldown in one channel, or in every channel. Returns the count."""
+        raise NotImplementedError
+
+    def delete_channel_cooldowns(self, channel_id):
+        """Deletes every user's cooldown in a channel. Returns the count."""
+        raise NotImplementedError
+
+    # Experience
+
+    def get_or_create_experience(self, user_id):
+        """Returns a user's total XP, or None after creating them with zero XP."""
+        raise NotImplementedError
+
+    def apply_xp(self, grants):
+        """
+        Records (user_id, delta, reason) grants in one commit.
+
+        Returns:
+            A list of (user_id, total XP, level) for every updated user.
+        """
+        raise NotImplementedError
+
+    def snapshot_experience(self):
+        """
+        Folds XP granted since the last snapshot into each user's total.
+
+        Returns:
+            A list of (user_id, total XP, level) for every user that changed.
+        """
+        return []
+
+    def reset_experience(self, user_id):
+        """Sets a user's XP and level to zero. Returns False if they had no record."""
+        raise NotImplementedError
+
+    def recompute_levels(self, after_user_id, chunk_size):
+        """
+        Recomputes the levels of the next ``chunk_size`` users, in user ID
+        order, from their XP. Call ``snapshot_experience`` first.
+
+        Returns:
+            A tuple of the last user ID in the chunk (None once past the
+            end), the number of users checked, and the number updated.
+        """
+        raise NotImplementedError
+
+    def get_level_curve(self):
+        """Returns the XP curve the stored levels were computed with."""
+        raise NotImplementedError
+
+    def set_level_curve(self, curve):
+        """Records the XP curve the stored levels were computed with."""
+        raise NotImplementedError
+
+    def top_experience(self, limit):
+        """Returns up to ``limit`` (user_id, XP, level) rows, best first."""
+        raise NotImplementedError
+
+    def experience_rank(self, user_id, k):
+        """
+        Finds a user's leaderboard position and the users around them.
+
+        Users are ordered like ``top_experience``: level, then XP, then the
+        lower user ID first.
+
+        Returns:
+            (rank, rows), where rank starts at 1 and rows are the (user_id,
+            XP, level) of up to ``k`` users either side of the user, best
+            first and including the user. None if the user has no record.
+        """
+        raise NotImplementedError
+
+    # Minecraft links
+
+    def all_minecraft_users(self):
+        """Yields every (discord_user_id, minecraft_username) link."""
+        raise NotImplementedError
+
+    def add_minecraft_user(self, discord_user_id, minecraft_username):
+        """
+        Links a Discord user to a Minecraft name.
+
+        Returns False if either side is already linked. Minecraft names are
+        compared case-insensitively.
+        """
+        raise NotImplementedError
+
+    def get_minecraft_user(self, discord_user_id):
+        """Returns the Minecraft name linked to a Discord user, or None."""
+        raise NotImplementedError
+
+    def remove_minecraft_user(self, discord_user_id=None, minecraft_username=None):
+        """Removes a link by Discord ID or Minecraft name. Returns False if none existed."""
+        raise NotImplementedError
+
+
+def purge_expired_cooldowns(conn, now, batch_size):
+    """
+    Deletes up to ``batch_size`` cooldowns that ended at or before ``now``.
+    Shared with dbtool, which works on a plain connection.
+
+    Returns:
+        The number of cooldowns deleted.
+    """
+    return conn.execute(
+        """
+        DELETE FROM cooldowns
+        WHERE (user_id, channel_id) IN (
+            SELECT user_id, channel_id FROM cooldowns
+            WHERE cooldown_end_time <= ?
+            LIMIT ?
+        )
+        """,
+        (now, batch_size),
+    ).rowcount
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores everything in SQLite, in a file or in memory."""
+
+    name = "sqlite"
+
+    def __init__(self, path="database.db"):
+        self.connection = sqlite3.connect(
+            path,
+            isolation_level=None,  # Autocommit; transactions are explicit
+            check_same_thread=False,
+            factory=TimedConnection,  # Records per-statement latency
+        )
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # Safe with WAL, fewer fsyncs
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        for version in migrations.migrate(self.connection):
+            print(f"Applied database migration {version}")
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self, func, *args):
+        with transaction(self.connection) as conn:
+            return func(conn, *args)
+
+    def set_cooldowns(self, user_id, cooldowns):
+        self._transaction(
+            lambda conn: conn.executemany(
+                """
+                INSERT OR REPLACE INTO cooldowns (user_id, channel_id, cooldown_end_time)
+                VALUES (?, ?, ?)
+                """,
+                [(user_id, channel_id, end) for channel_id, end in cooldowns.items()],
+            )
+        )
+
+    def active_cooldowns(self, now):
+        return self.connection.execute(
+            """
+            SELECT user_id, channel_id, cooldown_end_time FROM cooldowns
+            WHERE cooldown_end_time > ?
+            """,
+            (now,),
+        )
+
+    def purge_expired_cooldowns(self, now, batch_size):
+        return purge_expired_cooldowns(self.connection, now, batch_size)
+
+    def delete_cooldowns(self, user_id, channel_id=None):
+        if channel_id is not None:
+            return self.connection.execute(
+                """
+                DELETE FROM cooldowns
+                WHERE user_id = ? AND channel_id = ?
+                """,
+                (user_id, channel_id),
+            ).rowcount
+        return self.connection.execute(
+            """
+            DELETE FROM cooldowns
+            WHERE user_id = ?
+            """,
+            (user_id,),
+        ).rowcount
+
+    def delete_channel_cooldowns(self, channel_id):
+        return self.connection.execute(
+            """
+            DELETE FROM cooldowns
+            WHERE channel_id = ?
+            """,
+            (channel_id,),
+        ).rowcount
+
+    def get_or_create_experience(self, user_id):
+        total_xp = ledger.user_total(self.connection, user_id)
+        if total_xp is not None:
+            return total_xp
+        # User not found, add them with 0 experience
+        self.connection.execute(
+            """
+            INSERT INTO experience (user_id, experience, level)
+            VALUES (?, 0, 0)
+            """,
+            (user_id,),
+        )
+        return None
+
+    def apply_xp(self, grants):
+        def _apply(conn):
+            # Grants are only appended; totals are snapshot plus ledger tail.
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM xp_ledger").fetchone()[0]
+            ledger.append(conn, grants)
+            return ledger.totals_since(conn, last_id)
+
+        return self._transaction(_apply)
+
+    def snapshot_experience(self):
+        return self._transaction(ledger.snapshot)
+
+    def reset_experience(self, user_id):
+        def _reset(conn):
+            if ledger.user_total(conn, user_id) is None:
+                return False
+            ledger.set_totals(conn, [(user_id, 0)], "reset")
+            return True
+
+        return self._transaction(_reset)
+
+    def recompute_levels(self, after_user_id, chunk_size):
+        return ledger.recompute_level_chunk(self.connection, after_user_id, chunk_size)
+
+    def get_level_curve(self):
+        return ledger.stored_curve(self.connection)
+
+    def set_level_curve(self, curve):
+        ledger.store_curve(self.connection, curve)
+
+    def top_experience(self, limit):
+        self.snapshot_experience()  # Ordered reads need every snapshot current
+        return self.connection.execute(
+            """
+            SELECT user_id, experience, level FROM experience
+            ORDER BY level DESC, experience DESC, user_id ASC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+
+    def experience_rank(self, user_id, k):
+        self.snapshot_experience()  # Ordered reads need every snapshot current
+        conn = self.connection
+        result = conn.execute(
+            "SELECT experience, level FROM experience WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not result:
+            return None
+        params = {"user_id": user_id, "experience": result[0], "level": result[1]}
+        # Each part is a range count on idx_experience_level_experience
+        # (which ends in user_id, the rowid), so no table rows are read.
+        ahead = conn.execute(
+            """
+            SELECT
+                (SELECT COUNT(*) FROM experience
+                 WHERE level > :level)
+              + (SELECT COUNT(*) FROM experience
+                 WHERE level = :level AND experience > :experience)
+              + (SELECT COUNT(*) FROM experience
+                 WHERE level = :level AND experience = :experience
+                 AND user_id < :user_id)
+            """,
+            params,
+        ).fetchone()[0]
+
+        # Neighbours are read in two index seeks per side, ties first, so
+        # a large block of users with equal XP is never scanned.
+        above = conn.execute(
+            """
+            SELECT user_id, experience, level FROM experience
+            WHERE level = :level AND experience = :experience AND user_id < :user_id
+            ORDER BY user_id DESC
+            LIMIT :k
+            """,
+            {**params, "k": k},
+        ).fetchall()
+        above += conn.execute(
+            """
+            SELECT user_id, experience, level FROM experience
+            WHERE (level, experience) > (:level, :experience)
+            ORDER BY level ASC, experience ASC, user_id DESC
+            LIMIT :k
+            """,
+            {**params, "k": k - len(above)},
+        ).fetchall()
+        below = conn.execute(
+            """
+            SELECT user_id, experience, level FROM experience
+            WHERE level = :level AND experience = :experience AND user_id > :user_id
+            ORDER BY user_id ASC
+            LIMIT :k
+            """,
+            {**params, "k": k},
+        ).fetchall()
+        below += conn.execute(
+            """
+            SELECT user_id, experience, level FROM experience
+            WHERE (level, experience) < (:level, :experience)
+            ORDER BY level DESC, experience DESC, user_id ASC
+            LIMIT :k
+            """,
+            {**params, "k": k - len(below)},
+        ).fetchall()
+        return ahead + 1, above[::-1] + [(user_id, *result)] + below
+
+    def all_minecraft_users(self):
+        return self.connection.execute(
+            "SELECT discord_user_id, minecraft_username FROM minecraft_users"
+        )
+
+    def add_minecraft_user(self, discord_user_id, minecraft_username):
+        return (
+            self.connection.execute(
+                """
+                INSERT OR IGNORE INTO minecraft_users (discord_user_id, minecraft_username)
+                VALUES (?, ?)
+                """,
+                (discord_user_id, minecraft_username),
+            ).rowcount
+            > 0
+        )
+
+    def get_minecraft_user(self, discord_user_id):
+        result = self.connection.execute(
+            """
+            SELECT minecraft_username FROM minecraft_users
+            WHERE discord_user_id = ?
+            """,
+            (discord_user_id,),
+        ).fetchone()
+        return result[0] if result else None
+
+    def remove_minecraft_user(self, discord_user_id=None, minecraft_username=None):
+        def _remove(conn):
+            user_id = discord_user_id
+            if user_id is None:
+                result = conn.execute(
+                    """
+                    SELECT discord_user_id FROM minecraft_users
+                    WHERE minecraft_username = ? COLLATE NOCASE
+                    """,
+                    (minecraft_username,),
+                ).fetchone()
+                if not result:
+                    return False
+                user_id = result[0]
+            return (
+                conn.execute(
+                    """
+                    DELETE FROM minecraft_users
+                    WHERE discord_user_id = ?
+                    """,
+                    (user_id,),
+                ).rowcount
+                > 0
+            )
+
+        return self._transaction(_remove)
+
+
+class MemoryBackend(StorageBackend):
+    """Keeps everything in plain dicts. Nothing survives a restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.cooldowns = {}  # (user_id, channel_id) -> end time
+        self.experience = {}  # user_id -> (XP, level)
+        self.xp_ledger = []  # (user_id, delta, reason, ts)
+        self.minecraft_users = {}  # discord_user_id -> Minecraft name
+        self._minecraft_user_ids = {}  # lowercased Minecraft name -> discord_user_id
+        self.level_curve = levels.DEFAULT_CURVE
+
+    def set_cooldowns(self, user_id, cooldowns):
+        for channel_id, end in cooldowns.items():
+            self.cooldowns[(user_id, channel_id)] = end
+
+    def active_cooldowns(self, now):
+        return [
+            (user_id, channel_id, end)
+            for (user_id, channel_id), end in self.cooldowns.items()
+            if end > now
+        ]
+
+    def purge_expired_cooldowns(self, now, batch_size):
+        expired = []
+        for key, end in self.cooldowns.items():
+            if end <= now:
+                expired.append(key)
+                if len(expired) == batch_size:
+                    break
+        for key in expired:
+            del self.cooldowns[key]
+        return len(expired)
+
+    def delete_cooldowns(self, user_id, channel_id=None):
+        if channel_id is not None:
+            return int(self.cooldowns.pop((user_id, channel_id), None) is not None)
+        return self._delete_where(lambda key: key[0] == user_id)
+
+    def delete_channel_cooldowns(self, channel_id):
+        return self._delete_where(lambda key: key[1] == channel_id)
+
+    def _delete_where(self, predicate):
+        keys = [key for key in self.cooldowns if predicate(key)]
+        for key in keys:
+            del self.cooldowns[key]
+        return len(keys)
+
+    def get_or_create_experience(self, user_id):
+        if user_id in self.experience:
+            return self.experience[user_id][0]
+        self.experience[user_id] = (0, 0)
+        return None
+
+    def apply_xp(self, grants):
+        ts = int(time.time())
+        totals = {}
+        for user_id, delta, reason in grants:
+            self.xp_ledger.append((user_id, delta, reason, ts))
+            new_xp = self.experience.get(user_id, (0, 0))[0] + delta
+            level = levels.level_from_xp(new_xp)
+            self.experience[user_id] = (new_xp, level)
+            totals[user_id] = (user_id, new_xp, level)
+        return list(totals.values())
+
+    def reset_experience(self, user_id):
+        if user_id not in self.experience:
+            return False
+        xp = self.experience[user_id][0]
+        if xp:
+            self.xp_ledger.append((user_id, -xp, "reset", int(time.time())))
+        self.experience[user_id] = (0, 0)
+        return True
+
+    def recompute_levels(self, after_user_id, chunk_size):
+        user_ids = sorted(user_id for user_id in self.experience if user_id > after_user_id)
+        user_ids = user_ids[:chunk_size]
+        if not user_ids:
+            return None, 0, 0
+        totals = [self.experience[user_id][0] for user_id in user_ids]
+        updated = 0
+        for user_id, xp, level in zip(user_ids, totals, levels.levels_from_xp(totals)):
+            if self.experience[user_id][1] != level:
+                self.experience[user_id] = (xp, level)
+                updated += 1
+        return user_ids[-1], len(user_ids), updated
+
+    def get_level_curve(self):
+        return self.level_curve
+
+    def set_level_curve(self, curve):
+        self.level_curve = tuple(curve)
+
+    def top_experience(self, limit):
+        rows = heapq.nsmallest(
+            limit,
+            self.experience.items(),
+            key=lambda item: (-item[1][1], -item[1][0], item[0]),
+        )
+        return [(user_id, xp, level) for user_id, (xp, level) in rows]
+
+    def experience_rank(self, user_id, k):
+        if user_id not in self.experience:
+            return None
+        rows = self.top_experience(len(self.experience))
+        index = next(i for i, row in enumerate(rows) if row[0] == user_id)
+        return index + 1, rows[max(index - k, 0) : index + k + 1]
+
+    def all_minecraft_users(self):
+        return list(self.minecraft_users.items())
+
+    def add_minecraft_user(self, discord_user_id, minecraft_username):
+        if (
+            discord_user_id in self.minecraft_users
+            or minecraft_username.lower() in self._minecraft_user_ids
+        ):
+            return False
+        self.minecraft_users[discord_user_id] = minecraft_username
+        self._minecraft_user_ids[minecraft_username.lower()] = discord_user_id
+        return True
+
+    def get_minecraft_user(self, discord_user_id):
+        return self.minecraft_users.get(discord_user_id)
+
+    def remove_minecraft_user(self, discord_user_id=None, minecraft_username=None):
+        if discord_user_id is None:
+            discord_user_id = self._minecraft_user_ids.get(minecraft_username.lower())
+        minecraft_username = self.minecraft_users.pop(discord_user_id, None)
+        if minecraft_username is None:
+            return False
+        del self._minecraft_user_ids[minecraft_username.lower()]
+        return True
+
+
+BACKENDS = ("sqlite", "sqlite-memory", "memory")
+
+
+def create_backend(name="sqlite", path="database.db"):
+    """
+    Creates a storage backend by name.
+
+    Args:
+        name: "sqlite" for a database file, "sqlite-memory" for a private
+            in-memory SQLite database, or "memory" for plain dicts.
+        path: The database file used by the "sqlite" backend.
+    """
+    if name == "sqlite":
+        return SQLiteBackend(path)
+    if name == "sqlite-memory":
+        backend = SQLiteBackend(":memory:")
+        backend.name = name
+        return backend
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown database backend {name!r}; expected one of {BACKENDS}")
@@ -0,0 +1,87 @@
+import datetime
+import glob
+import os
+import sqlite3
+
+# Online backups of the SQLite database file.
+#
+# A backup reads the database through its own connection while holding a
+# read transaction. In WAL mode that pins one snapshot of the database, so
+# the bot keeps writing while the copy is taken and the backup never has to
+# restart because the source changed underneath it.
+
+
+def _snapshot_glob(directory, source_path):
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(directory, f"{stem}-*.db")
+
+
+def list_backups(directory, source_path):
+    """
+    Lists the backups of a database, newest first.
+
+    Returns:
+        A list of (path, size in bytes, modification time) tuples.
+    """
+    backups = []
+    for path in glob.glob(_snapshot_glob(directory, source_path)):
+        stat = os.stat(path)
+        backups.append((path, stat.st_size, stat.st_mtime))
+    return sorted(backups, key=lambda backup: backup[0], reverse=True)
+
+
+def rotate_backups(directory, source_path, keep):
+    """Deletes all but the newest ``keep`` backups. Returns the deleted paths."""
+    removed = []
+    for path, _, _ in list_backups(directory, source_path)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def backup_database(source_path, directory, keep=7, pages=256, sleep=0.005):
+    """
+    Copies a live database into a new timestamped snapshot.
+
+    The copy is taken ``pages`` pages at a time, sleeping ``sleep`` seconds
+    between batches so the bot's own queries get the disk in between. The
+    snapshot is written to a temporary file and renamed into place once
+    complete, so a crash never leaves a torn backup behind.
+
+    Args:
+        source_path: The database file to back up.
+        directory: Where snapshots are kept. Created if missing.
+        keep: How many snapshots to keep; older ones are deleted.
+        pages: How many pages to copy per batch.
+        sleep: Seconds to pause between batches.
+
+    Returns:
+        The path of the new snapshot.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{stem}-{timestamp}.db")
+    temp_path = f"{path}.tmp"
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            # Pin a read snapshot for the whole copy (see the module comment).
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            source.backup(target, pages=pages, sleep=sleep)
+            source.execute("COMMIT")
+        finally:
+            target.close()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+
+    os.replace(temp_path, path)
+    rotate_backups(directory, source_path, keep)
+    return path
@@ -0,0 +1,116 @@
+"""
+Micro-benchmarks for the Database storage backends.
+
+Runs the same cooldown, XP and Minecraft-link workload against each backend
+so they can be compared under our load. The sqlite backend writes to a
+temporary file that is deleted afterwards.
+
+Usage:
+    python -m cogs.utils.benchmark --users 10000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from .backends import BACKENDS, create_backend
+
+CHANNELS = (1001, 1002, 1003)  # Cooldown channels every user posts in
+
+
+def _timed(results, name, operations, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    results.append((name, operations, elapsed))
+
+
+def run_workload(backend, users, seed=0):
+    """
+    Runs the benchmark workload against a backend.
+
+    Returns:
+        A list of (operation, operation count, seconds) tuples.
+    """
+    rng = random.Random(seed)
+    user_ids = [10**17 + i for i in range(users)]
+    now = int(time.time())
+    results = []
+
+    def set_cooldowns():
+        for user_id in user_ids:
+            ends = now + rng.choice((-600, 600))  # Half already expired
+            backend.set_cooldowns(user_id, {channel: ends for channel in CHANNELS})
+
+    def scan_active_cooldowns():
+        for _ in backend.active_cooldowns(now):
+            pass
+
+    def purge_expired_cooldowns():
+        while backend.purge_expired_cooldowns(now, 500) == 500:
+            pass
+
+    def apply_xp():
+        for start in range(0, users * 10, 500):
+            backend.apply_xp(
+                [
+                    (rng.choice(user_ids), rng.randrange(15, 26), "message")
+                    for _ in range(500)
+                ]
+            )
+
+    def get_experience():
+        for user_id in user_ids:
+            backend.get_or_create_experience(user_id)
+
+    def top_experience():
+        for _ in range(100):
+            backend.top_experience(200)
+
+    def minecraft_links():
+        for user_id in user_ids:
+            backend.add_minecraft_user(user_id, f"player{user_id % 10**6}")
+        for user_id in user_ids:
+            backend.get_minecraft_user(user_id)
+        for user_id in user_ids[::2]:
+            backend.remove_minecraft_user(discord_user_id=user_id)
+
+    _timed(results, "set_cooldowns", users, set_cooldowns)
+    _timed(results, "active_cooldowns scan", 1, scan_active_cooldowns)
+    _timed(results, "purge_expired_cooldowns", 1, purge_expired_cooldowns)
+    _timed(results, "apply_xp (500/batch)", users * 10 // 500, apply_xp)
+    _timed(results, "snapshot_experience", 1, backend.snapshot_experience)
+    _timed(results, "get_or_create_experience", users, get_experience)
+    _timed(results, "top_experience(200)", 100, top_experience)
+    _timed(results, "minecraft add/get/remove", users * 2 + users // 2, minecraft_links)
+    return results
+
+
+def run(backend_names=BACKENDS, users=10000):
+    """Benchmarks each named backend and prints a comparison table."""
+    with tempfile.TemporaryDirectory() as directory:
+        for name in backend_names:
+            backend = create_backend(name, os.path.join(directory, f"{name}.db"))
+            try:
+                results = run_workload(backend, users)
+            finally:
+                backend.close()
+            print(f"\n{name} ({users} users)")
+            for operation, count, elapsed in results:
+                print(
+                    f"  {operation:<28} {elapsed * 1000:>10.1f} ms"
+                    f" {count / elapsed if elapsed else float('inf'):>12.0f} ops/s"
+                )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cogs.utils.benchmark")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args(argv)
+    run(args.backends, args.users)
+
+
+if __name__ == "__main__":
+    main()
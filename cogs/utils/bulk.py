@@ -0,0 +1,129 @@
+import csv
+import itertools
+import json
+from . import ledger, levels
+from .transactions import transaction
+
+# Tables that can be imported and exported, with their columns in file order.
+TABLES = {
+    "experience": ("user_id", "experience", "level"),
+    "minecraft_users": ("discord_user_id", "minecraft_username"),
+}
+
+FORMATS = ("csv", "jsonl")
+
+
+def format_from_filename(filename):
+    """Returns the bulk format implied by a file extension, or None."""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+def chunked(iterable, size):
+    """Yields lists of up to ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _normalize(table, record):
+    """Turns one parsed record into a parameter tuple for the table's INSERT."""
+    if table == "experience":
+        # The level is always derived from the total XP so the two can't disagree
+        experience = int(record["experience"])
+        return int(record["user_id"]), experience, levels.level_from_xp(experience)
+    return int(record["discord_user_id"]), str(record["minecraft_username"])
+
+
+def read_rows(fp, fmt, table):
+    """
+    Lazily parses a CSV (with a header row) or JSONL file into row tuples.
+
+    Args:
+        fp: A text file object opened for reading.
+        fmt: Either "csv" or "jsonl".
+        table: The table the rows are destined for.
+    """
+    if fmt == "csv":
+        records = csv.DictReader(fp)
+    else:
+        records = (json.loads(line) for line in fp if line.strip())
+    for record in records:
+        yield _normalize(table, record)
+
+
+class RowWriter:
+    """Writes row tuples of a table to a CSV or JSONL file."""
+
+    def __init__(self, fp, fmt, table):
+        self.fp = fp
+        self.fmt = fmt
+        self.columns = TABLES[table]
+        if fmt == "csv":
+            self._writer = csv.writer(fp)
+            self._writer.writerow(self.columns)
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self._writer.writerows(rows)
+            return
+        for row in rows:
+            self.fp.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+
+
+def import_chunk(conn, table, rows):
+    """
+    Upserts a chunk of row tuples. Returns the number of rows written.
+
+    Experience totals go through the XP ledger as "import" adjustments,
+    so the ledger still adds up to every user's total afterwards.
+    """
+    if table == "experience":
+        ledger.set_totals(conn, [(user_id, xp) for user_id, xp, _ in rows], "import")
+        return len(rows)
+    columns = TABLES[table]
+    conn.executemany(
+        f"""
+        INSERT OR REPLACE INTO {table} ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+def export_query(table):
+    """Returns the SELECT statement that exports a table."""
+    return f"SELECT {', '.join(TABLES[table])} FROM {table} ORDER BY rowid"
+
+
+def import_file(conn, table, fp, fmt, chunk_size=5000):
+    """
+    Streams a file into a table, committing once per chunk.
+
+    ``conn`` must be in autocommit mode (``isolation_level=None``).
+
+    Returns:
+        The number of rows imported.
+    """
+    imported = 0
+    for rows in chunked(read_rows(fp, fmt, table), chunk_size):
+        with transaction(conn):
+            imported += import_chunk(conn, table, rows)
+    return imported
+
+
+def export_file(conn, table, fp, fmt, chunk_size=5000):
+    """
+    Streams a table into a file using a ``fetchmany`` cursor.
+
+    Returns:
+        The number of rows exported.
+    """
+    writer = RowWriter(fp, fmt, table)
+    cursor = conn.execute(export_query(table))
+    exported = 0
+    while rows := cursor.fetchmany(chunk_size):
+        writer.write(rows)
+        exported += len(rows)
+    return exported
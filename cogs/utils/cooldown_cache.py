@@ -0,0 +1,93 @@
+import datetime
+import heapq
+
+
+class CooldownCache:
+    """
+    In-memory cooldown end times keyed by user, then channel.
+
+    Entries are dropped once their end time has passed, so the cache only
+    ever holds active cooldowns. A min-heap ordered by end time makes that
+    eviction cheap: each call only looks at the entries that just expired.
+    Grouping by user makes all of one user's cooldowns a single lookup.
+    """
+
+    def __init__(self):
+        self._entries = {}  # user_id -> {channel_id: cooldown end time}
+        self._expiry = []  # heap of (end time, user_id, channel_id)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def _pop(self, user_id, channel_id):
+        channels = self._entries.get(user_id)
+        if channels is None or channels.pop(channel_id, None) is None:
+            return False
+        if not channels:
+            del self._entries[user_id]
+        self._count -= 1
+        return True
+
+    def evict_expired(self, now=None):
+        """Removes every entry whose cooldown has ended. Returns how many were removed."""
+        now = now or self._now()
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            end_time, user_id, channel_id = heapq.heappop(self._expiry)
+            # The entry may have been replaced or discarded since it was pushed.
+            if self._entries.get(user_id, {}).get(channel_id) == end_time:
+                self._pop(user_id, channel_id)
+                removed += 1
+        return removed
+
+    def get(self, user_id, channel_id, now=None):
+        """Returns the active cooldown end time for a user in a channel, or None."""
+        now = now or self._now()
+        self.evict_expired(now)
+        return self._entries.get(user_id, {}).get(channel_id)
+
+    def get_user(self, user_id, now=None):
+        """Returns a copy of a user's active cooldowns as {channel_id: end time}."""
+        now = now or self._now()
+        self.evict_expired(now)
+        return dict(self._entries.get(user_id, {}))
+
+    def set(self, user_id, channel_id, end_time, now=None):
+        """Stores a cooldown end time. Already expired end times are not cached."""
+        now = now or self._now()
+        self.evict_expired(now)
+        if end_time <= now:
+            self._pop(user_id, channel_id)
+            return
+        channels = self._entries.setdefault(user_id, {})
+        if channel_id not in channels:
+            self._count += 1
+        channels[channel_id] = end_time
+        heapq.heappush(self._expiry, (end_time, user_id, channel_id))
+        # Replaced entries leave stale heap items behind; rebuild if they pile up.
+        if len(self._expiry) > 2 * self._count + 64:
+            self._expiry = [
+                (end, user, channel)
+                for user, channels in self._entries.items()
+                for channel, end in channels.items()
+            ]
+            heapq.heapify(self._expiry)
+
+    def discard(self, user_id, channel_id=None):
+        """Forgets a user's cooldown in one channel, or in every channel."""
+        if channel_id is not None:
+            self._pop(user_id, channel_id)
+            return
+        self._count -= len(self._entries.pop(user_id, {}))
+
+    def discard_channel(self, channel_id):
+        """Forgets every user's cooldown in a channel."""
+        for user_id in [
+            user_id for user_id, channels in self._entries.items() if channel_id in channels
+        ]:
+            self._pop(user_id, channel_id)
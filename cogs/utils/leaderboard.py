@@ -0,0 +1,61 @@
+import bisect
+
+
+class Leaderboard:
+    """
+    The top of the experience table, kept sorted in memory.
+
+    Holds the exact top ``len(entries)`` users, ordered by level, then
+    experience, then user ID. Updates only touch the cache when the user is
+    already in it or would rank inside it. When removals shrink it below
+    ``size``, the cache is marked stale and has to be reloaded from the
+    database.
+    """
+
+    def __init__(self, size=100, slack=100):
+        self.size = size
+        self.capacity = size + slack  # Headroom so resets rarely force a reload
+        self._entries = []  # sorted (-level, -experience, user_id)
+        self._keys = {}  # user_id -> its key in _entries
+        self._exhaustive = False  # True when _entries holds every row of the table
+        self.stale = True
+
+    @staticmethod
+    def _key(user_id, experience, level):
+        return (-level, -experience, user_id)
+
+    def load(self, rows):
+        """
+        Replaces the cache with rows from the database.
+
+        Args:
+            rows: Up to ``capacity`` (user_id, experience, level) tuples, best first.
+        """
+        self._entries = sorted(self._key(*row) for row in rows)
+        self._keys = {key[2]: key for key in self._entries}
+        self._exhaustive = len(self._entries) < self.capacity
+        self.stale = False
+
+    def update(self, user_id, experience, level):
+        """Records a user's new experience and level."""
+        if self.stale:
+            return
+        old_key = self._keys.pop(user_id, None)
+        if old_key is not None:
+            del self._entries[bisect.bisect_left(self._entries, old_key)]
+
+        key = self._key(user_id, experience, level)
+        if self._exhaustive or (self._entries and key < self._entries[-1]):
+            bisect.insort(self._entries, key)
+            self._keys[user_id] = key
+            if len(self._entries) > self.capacity:
+                del self._keys[self._entries.pop()[2]]
+                self._exhaustive = False
+
+        if not self._exhaustive and len(self._entries) < self.size:
+            self.stale = True
+
+    def top(self, limit=None):
+        """Returns ``[user_id, level]`` pairs for the best ``limit`` users."""
+        limit = min(limit or self.size, self.size)
+        return [[user_id, -level] for level, _, user_id in self._entries[:limit]]
@@ -0,0 +1,286 @@
+import json
+import time
+from . import levels
+from .transactions import transaction
+
+# The XP ledger.
+#
+# Every XP change is appended to xp_ledger as (user_id, delta, reason, ts);
+# the ledger is the source of truth. The experience table holds a snapshot
+# of each user's total, folded in from the ledger up to experience.ledger_id.
+# A user's current total is their snapshot plus the tail of ledger entries
+# after it. xp_ledger_state.ledger_id is the last entry folded for everyone.
+#
+# Apart from the level recompute, none of these functions open transactions;
+# callers wrap writes in one.
+
+
+def append(conn, grants, ts=None):
+    """Appends (user_id, delta, reason) grants to the ledger."""
+    ts = int(time.time()) if ts is None else ts
+    conn.executemany(
+        "INSERT INTO xp_ledger (user_id, delta, reason, ts) VALUES (?, ?, ?, ?)",
+        [(user_id, delta, reason, ts) for user_id, delta, reason in grants],
+    )
+
+
+def user_total(conn, user_id):
+    """
+    Returns a user's total XP (snapshot plus tail), or None if they have
+    neither a snapshot nor any ledger entries.
+    """
+    snapshot = conn.execute(
+        "SELECT experience, ledger_id FROM experience WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    experience, ledger_id = snapshot or (0, 0)
+    tail = conn.execute(
+        """
+        SELECT COUNT(*), TOTAL(delta) FROM xp_ledger
+        WHERE user_id = ? AND id > ?
+        """,
+        (user_id, ledger_id),
+    ).fetchone()
+    if snapshot is None and not tail[0]:
+        return None
+    return experience + int(tail[1])
+
+
+def totals_since(conn, ledger_id):
+    """
+    Returns (user_id, total XP, level) for every user with ledger entries
+    after ``ledger_id``.
+    """
+    rows = conn.execute(
+        """
+        SELECT t.user_id, COALESCE(e.experience, 0) + (
+            SELECT SUM(delta) FROM xp_ledger l
+            WHERE l.user_id = t.user_id AND l.id > COALESCE(e.ledger_id, 0)
+        )
+        FROM (
+            SELECT DISTINCT user_id FROM xp_ledger NOT INDEXED WHERE id > ?
+        ) t
+        LEFT JOIN experience e ON e.user_id = t.user_id
+        """,
+        (ledger_id,),
+    ).fetchall()
+    return [(user_id, total, levels.level_from_xp(total)) for user_id, total in rows]
+
+
+def snapshot(conn):
+    """
+    Folds every ledger entry since the last snapshot into the experience table.
+
+    Returns:
+        A list of (user_id, total XP, level) for every user that changed.
+    """
+    watermark = conn.execute("SELECT ledger_id FROM xp_ledger_state").fetchone()[0]
+    rows = conn.execute(
+        """
+        SELECT l.user_id, COALESCE(e.experience, 0) + SUM(l.delta), MAX(l.id)
+        FROM xp_ledger AS l NOT INDEXED  -- Seek the id range, not the user index
+        LEFT JOIN experience e ON e.user_id = l.user_id
+        WHERE l.id > ?
+        GROUP BY l.user_id
+        """,
+        (watermark,),
+    ).fetchall()
+    if not rows:
+        return []
+    conn.executemany(
+        """
+        INSERT INTO experience (user_id, experience, level, ledger_id)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE
+        SET experience = excluded.experience,
+            level = excluded.level,
+            ledger_id = excluded.ledger_id
+        """,
+        [
+            (user_id, total, levels.level_from_xp(total), ledger_id)
+            for user_id, total, ledger_id in rows
+        ],
+    )
+    conn.execute(
+        "UPDATE xp_ledger_state SET ledger_id = ?",
+        (max(ledger_id for _, _, ledger_id in rows),),
+    )
+    return [
+        (user_id, total, levels.level_from_xp(total)) for user_id, total, _ in rows
+    ]
+
+
+def set_totals(conn, totals, reason):
+    """
+    Sets users' totals by appending the difference to the ledger, then
+    snapshots. Used for resets and imports so the ledger stays the source
+    of truth.
+
+    Args:
+        totals: (user_id, total XP) pairs.
+        reason: The ledger reason recorded for the adjustments.
+    """
+    adjustments = []
+    for user_id, total in totals:
+        delta = total - (user_total(conn, user_id) or 0)
+        if delta:
+            adjustments.append((user_id, delta, reason))
+    append(conn, adjustments)
+    snapshot(conn)
+
+
+def audit(conn):
+    """
+    Replays the whole ledger and compares it with the snapshots.
+
+    Returns:
+        A list of (user_id, snapshot total, ledger total) for every user
+        whose snapshot doesn't match the sum of their ledger entries.
+    """
+    snapshot(conn)
+    return conn.execute(
+        """
+        SELECT user_id, snapshot_total, ledger_total FROM (
+            SELECT e.user_id, e.experience AS snapshot_total,
+                   COALESCE((SELECT SUM(delta) FROM xp_ledger l
+                             WHERE l.user_id = e.user_id), 0) AS ledger_total
+            FROM experience e
+        )
+        WHERE snapshot_total != ledger_total
+        """
+    ).fetchall()
+
+
+def rebuild(conn):
+    """
+    Rebuilds every snapshot by replaying the whole ledger.
+
+    Returns:
+        The number of snapshots rebuilt.
+    """
+    conn.execute("UPDATE experience SET experience = 0, level = 0, ledger_id = 0")
+    conn.execute("UPDATE xp_ledger_state SET ledger_id = 0")
+    return len(snapshot(conn))
+
+
+def compact(conn, before):
+    """
+    Collapses each user's ledger entries older than ``before`` (epoch
+    seconds) into one "compacted" entry. Totals are unchanged; only the
+    per-grant history before that time is dropped. Entries that haven't
+    been snapshotted yet are never touched.
+
+    Returns:
+        The number of ledger entries removed.
+    """
+    snapshot(conn)
+    params = {
+        "before": before,
+        "watermark": conn.execute("SELECT ledger_id FROM xp_ledger_state").fetchone()[0],
+    }
+    conn.execute(
+        """
+        CREATE TEMP TABLE compacted AS
+        SELECT user_id, SUM(delta) AS delta, MAX(id) AS id FROM xp_ledger
+        WHERE id <= :watermark AND ts < :before
+        GROUP BY user_id
+        HAVING COUNT(*) > 1
+        """,
+        params,
+    )
+    try:
+        removed = conn.execute(
+            """
+            DELETE FROM xp_ledger
+            WHERE id <= :watermark AND ts < :before
+            AND user_id IN (SELECT user_id FROM compacted)
+            AND id NOT IN (SELECT id FROM compacted)
+            """,
+            params,
+        ).rowcount
+        # The newest entry of each user stands in for the ones removed.
+        conn.execute(
+            """
+            UPDATE xp_ledger
+            SET delta = (SELECT delta FROM compacted WHERE compacted.id = xp_ledger.id),
+                reason = 'compacted'
+            WHERE id IN (SELECT id FROM compacted)
+            """
+        )
+    finally:
+        conn.execute("DROP TABLE temp.compacted")
+    return removed
+
+
+def stored_curve(conn):
+    """Returns the XP curve the stored levels were computed with."""
+    return tuple(
+        json.loads(conn.execute("SELECT coefficients FROM level_curve").fetchone()[0])
+    )
+
+
+def store_curve(conn, curve):
+    """Records ``curve`` as the one the stored levels were computed with."""
+    conn.execute("UPDATE level_curve SET coefficients = ?", (json.dumps(list(curve)),))
+
+
+def recompute_level_chunk(conn, after_user_id, chunk_size):
+    """
+    Recomputes the levels of the next ``chunk_size`` users after
+    ``after_user_id``, in ``user_id`` order, from their XP.
+
+    Levels for the whole chunk are computed at once, and only rows whose
+    level changed are written, in one transaction.
+
+    Returns:
+        A tuple of the last user ID in the chunk (None once past the end),
+        the number of users checked, and the number updated.
+    """
+    rows = conn.execute(
+        """
+        SELECT user_id, experience, level FROM experience
+        WHERE user_id > ?
+        ORDER BY user_id
+        LIMIT ?
+        """,
+        (after_user_id, chunk_size),
+    ).fetchall()
+    if not rows:
+        return None, 0, 0
+    user_ids, totals, old_levels = zip(*rows)
+    changed = [
+        (level, user_id)
+        for user_id, level, old_level in zip(
+            user_ids, levels.levels_from_xp(totals), old_levels
+        )
+        if level != old_level
+    ]
+    if changed:
+        with transaction(conn):
+            conn.executemany("UPDATE experience SET level = ? WHERE user_id = ?", changed)
+    return user_ids[-1], len(rows), len(changed)
+
+
+def recompute_levels(conn, chunk_size=50000):
+    """
+    Recomputes every user's level from their XP, e.g. after the XP curve
+    changes, one chunk at a time, then records the curve used. ``conn``
+    must be in autocommit mode (``isolation_level=None``).
+
+    Returns:
+        A tuple of the number of users checked and the number updated.
+    """
+    with transaction(conn):
+        snapshot(conn)
+
+    curve = levels.current_curve()
+    checked = updated = 0
+    last_user_id = -1
+    while True:
+        last_user_id, chunk_checked, chunk_updated = recompute_level_chunk(
+            conn, last_user_id, chunk_size
+        )
+        if last_user_id is None:
+            store_curve(conn, curve)
+            return checked, updated
+        checked += chunk_checked
+        updated += chunk_updated
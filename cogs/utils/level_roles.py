@@ -0,0 +1,120 @@
+def member_role_ids(member):
+    """
+    Returns the IDs of a member's roles, without building Role objects.
+
+    This is the only place that reads discord.py's private ``Member._roles``,
+    the sorted role ID array that ``Member.roles`` is built from. It was
+    checked against discord.py 2.4.0, the version pinned in requirements.txt.
+    If an upgrade drops the field, this falls back to the public, slower
+    ``Member.roles``.
+    """
+    role_ids = getattr(member, "_roles", None)
+    if role_ids is None:
+        return [role.id for role in member.roles]
+    return role_ids
+
+
+def parse_level(role_name):
+    """Returns N for a role named '[Level N] Name', or None for any other role."""
+    if not role_name.startswith("[Level "):
+        return None
+    try:
+        return int(role_name[len("[Level ") :].split("]")[0])
+    except ValueError:
+        return None
+
+
+class LevelRoleIndex:
+    """
+    The '[Level N] Name' roles of every guild, as role_id -> level.
+
+    Guilds are indexed the first time they're looked up and then kept in
+    step by the role create/update/delete events, so renaming or adding a
+    level role takes effect without reloading anything. A member's highest
+    level is one dict lookup per role they have.
+
+    There's one index per bot, shared by every cog; use ``get_level_role_index``.
+    """
+
+    def __init__(self):
+        self._guilds = {}  # guild_id -> {role_id: level}
+        self.version = 0
+
+    def attach(self, bot):
+        """Subscribes the index to the bot's role and guild events."""
+        for listener in (
+            self.on_guild_role_create,
+            self.on_guild_role_update,
+            self.on_guild_role_delete,
+            self.on_guild_remove,
+        ):
+            bot.add_listener(listener)
+
+    def _levels(self, guild):
+        levels = self._guilds.get(guild.id)
+        if levels is None:
+            levels = self._guilds[guild.id] = {}
+            for role in guild.roles:
+                level = parse_level(role.name)
+                if level is not None:
+                    levels[role.id] = level
+        return levels
+
+    def level_roles(self, guild):
+        """Returns the guild's level roles as {role_id: level}. Don't modify it."""
+        return self._levels(guild)
+
+    def highest_level(self, member, guild=None):
+        """
+        Returns the level of the member's highest level role, or 0 if they
+        have none.
+
+        Args:
+            member: The member whose roles are checked.
+            guild: Whose level roles count; defaults to the member's guild.
+        """
+        levels = self._levels(guild or member.guild)
+        return max(
+            (levels[role_id] for role_id in member_role_ids(member) if role_id in levels),
+            default=0,
+        )
+
+    async def on_guild_role_create(self, role):
+        levels = self._guilds.get(role.guild.id)
+        if levels is None:
+            return  # Not indexed yet; it'll be read with the rest of the guild
+        level = parse_level(role.name)
+        if level is not None:
+            levels[role.id] = level
+            self.version += 1
+
+    async def on_guild_role_update(self, before, after):
+        levels = self._guilds.get(after.guild.id)
+        if levels is None:
+            return
+        level = parse_level(after.name)
+        if level == levels.get(after.id):
+            return  # Renamed without changing its level
+        if level is None:
+            del levels[after.id]
+        else:
+            levels[after.id] = level
+        self.version += 1
+
+    async def on_guild_role_delete(self, role):
+        levels = self._guilds.get(role.guild.id)
+        if levels is not None and levels.pop(role.id, None) is not None:
+            self.version += 1
+
+    async def on_guild_remove(self, guild):
+        if self._guilds.pop(guild.id, None) is not None:
+            self.version += 1
+
+
+def get_level_role_index(bot):
+    """Returns the bot's shared LevelRoleIndex, creating and attaching it on first use."""
+    index = getattr(bot, "level_role_index", None)
+    if index is None:
+        index = bot.level_role_index = LevelRoleIndex()
+        index.attach(bot)
+    return index
@@ -0,0 +1,160 @@
+import bisect
+
+try:
+    import numpy
+except ImportError:  # Optional; only speeds up levels_from_xp
+    numpy = None
+
+# The XP curve is a polynomial in the current level, given as coefficients
+# with the highest power first: (5, 50, 100) means going from level l to
+# l + 1 takes 5 * l^2 + 50 * l + 100 XP. It comes from "xp_curve" in
+# config.json.
+DEFAULT_CURVE = (5, 50, 100)
+
+# (curve, cumulative) where cumulative[l] is the total XP needed to reach
+# level l from zero. Both are tuples and are only ever replaced as a pair,
+# so the database thread can keep reading while the curve is reconfigured.
+_state = (DEFAULT_CURVE, (0,))
+
+
+def compile_curve(coefficients):
+    """
+    Validates XP curve coefficients from the config.
+
+    Every level has to cost at least 1 XP, so the coefficients must be
+    non-negative integers with a positive constant term. JSON ``true`` and
+    ``false`` are rejected even though Python treats bools as ints.
+
+    Returns:
+        The coefficients as a tuple.
+
+    Raises:
+        ValueError: If the curve is invalid.
+    """
+    curve = tuple(coefficients)
+    if (
+        not curve
+        or not all(isinstance(c, int) and not isinstance(c, bool) and c >= 0 for c in curve)
+        or curve[-1] <= 0
+    ):
+        raise ValueError(
+            f"Invalid XP curve {list(curve)}: expected non-negative integer "
+            "coefficients, highest power first, ending in a positive constant"
+        )
+    return curve
+
+
+def configure(coefficients=None):
+    """
+    Switches to a new XP curve, rebuilding the cumulative table only if the
+    curve actually changed.
+
+    Args:
+        coefficients: The curve from the config, or None for the default.
+
+    Returns:
+        True if the curve changed, in which case stored levels are stale.
+    """
+    global _state
+    curve = DEFAULT_CURVE if coefficients is None else compile_curve(coefficients)
+    if curve == _state[0]:
+        return False
+    _state = (curve, (0,))
+    _table(0, PREBUILT_LEVELS)
+    return True
+
+
+def current_curve():
+    """Returns the coefficients of the XP curve in use."""
+    return _state[0]
+
+
+def _xp_for_next_level(curve, level):
+    xp = 0
+    for coefficient in curve:
+        xp = xp * level + coefficient
+    return xp
+
+
+def xp_for_next_level(level):
+    """Returns the XP needed to go from ``level`` to ``level + 1``."""
+    return _xp_for_next_level(_state[0], level)
+
+
+def _table(total_xp, level=0):
+    """
+    Returns the cumulative table, grown first if it doesn't cover both
+    ``total_xp`` and ``level``.
+    """
+    global _state
+    curve, cumulative = state = _state
+    if cumulative[-1] > total_xp and len(cumulative) > level:
+        return cumulative
+    grown = list(cumulative)
+    while grown[-1] <= total_xp or len(grown) <= level:
+        grown.append(grown[-1] + _xp_for_next_level(curve, len(grown) - 1))
+    cumulative = tuple(grown)
+    if _state is state:  # Don't clobber a curve configured in the meantime
+        _state = (curve, cumulative)
+    return cumulative
+
+
+PREBUILT_LEVELS = 200  # The table is grown on demand past this
+_table(0, PREBUILT_LEVELS)
+
+
+def xp_to_reach(level):
+    """Returns the total XP needed to reach ``level``."""
+    return _table(0, level)[level]
+
+
+def level_from_xp(total_xp):
+    """
+    Returns the level reached with ``total_xp`` experience. Negative totals,
+    e.g. after XP was removed, are level 0.
+    """
+    return max(bisect.bisect_right(_table(total_xp), total_xp) - 1, 0)
+
+
+def levels_from_xp(totals):
+    """
+    Returns the level for each of many XP totals at once. Negative totals
+    are level 0, as in ``level_from_xp``.
+
+    Uses a single NumPy ``searchsorted`` over the cumulative table when
+    NumPy is installed, and ``bisect`` per total otherwise.
+
+    Args:
+        totals: A sequence of total XP amounts.
+
+    Returns:
+        A list of levels, in the same order as ``totals``.
+    """
+    if not totals:
+        return []
+    cumulative = _table(max(totals))
+    if numpy is None:
+        return [
+            max(bisect.bisect_right(cumulative, total_xp) - 1, 0) for total_xp in totals
+        ]
+    thresholds = numpy.array(cumulative, dtype=numpy.int64)
+    return numpy.maximum(
+        numpy.searchsorted(thresholds, numpy.array(totals, dtype=numpy.int64), side="right")
+        - 1,
+        0,
+    ).tolist()
+
+
+def level_progress(total_xp):
+    """
+    Splits a total XP amount into level progress. A negative total is
+    level 0, with negative progress into it.
+
+    Returns:
+        A tuple of the XP earned within the current level, the level, and the
+        XP still needed to reach the next level.
+    """
+    cumulative = _table(total_xp)
+    level = max(bisect.bisect_right(cumulative, total_xp) - 1, 0)
+    xp_into_level = total_xp - cumulative[level]
+    return xp_into_level, level, cumulative[level + 1] - total_xp
@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+
+class MemberLevelCache:
+    """
+    A bounded memo of (guild_id, member_id) -> (highest level, cooldown reduction).
+
+    Working it out means walking the member's roles, but roles rarely
+    change, so the result is kept until the member's roles do. Once
+    ``size`` members are cached, the least recently used one is evicted.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, guild_id, member_id):
+        """Returns the cached (level, reduction), or None."""
+        key = (guild_id, member_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, guild_id, member_id, level, reduction):
+        key = (guild_id, member_id)
+        self._entries[key] = (level, reduction)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def discard(self, guild_id, member_id):
+        self._entries.pop((guild_id, member_id), None)
+
+    def clear(self):
+        self._entries.clear()
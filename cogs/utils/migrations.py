@@ -0,0 +1,268 @@
+import datetime
+from .transactions import transaction
+
+# Schema migrations for database.db, applied in order. The index of the last
+# applied migration is stored in ``PRAGMA user_version``, so each one runs
+# exactly once per database file. Never edit a released migration; append a
+# new one instead.
+
+
+def _baseline(conn):
+    """Creates the original tables for databases that predate versioning."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cooldowns (
+            user_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            cooldown_end_time TEXT NOT NULL,
+            PRIMARY KEY (user_id, channel_id)
+        )"""
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS minecraft_users (
+            discord_user_id INT NOT NULL,
+            minecraft_username TEXT NOT NULL,
+            PRIMARY KEY (discord_user_id)
+        )"""
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS experience (
+            user_id INTEGER PRIMARY KEY,
+            experience INTEGER NOT NULL DEFAULT 0,
+            level INTEGER NOT NULL DEFAULT 0
+        )"""
+    )
+
+
+def _compact_columns(conn):
+    """
+    Rebuilds every table with INTEGER ids and epoch-second cooldown end times.
+
+    Cooldowns were stored as TEXT ids and ISO-8601 strings, which is larger
+    on disk and has to be parsed on every read.
+    """
+    conn.execute(
+        """
+        CREATE TABLE cooldowns_new (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            cooldown_end_time INTEGER NOT NULL,
+            PRIMARY KEY (user_id, channel_id)
+        ) WITHOUT ROWID"""
+    )
+    rows = conn.execute("SELECT user_id, channel_id, cooldown_end_time FROM cooldowns")
+    conn.executemany(
+        "INSERT OR REPLACE INTO cooldowns_new VALUES (?, ?, ?)",
+        (
+            (
+                int(user_id),
+                int(channel_id),
+                int(datetime.datetime.fromisoformat(end_time).timestamp()),
+            )
+            for user_id, channel_id, end_time in rows
+        ),
+    )
+    conn.execute("DROP TABLE cooldowns")
+    conn.execute("ALTER TABLE cooldowns_new RENAME TO cooldowns")
+
+    conn.execute(
+        """
+        CREATE TABLE minecraft_users_new (
+            discord_user_id INTEGER PRIMARY KEY,
+            minecraft_username TEXT NOT NULL
+        )"""
+    )
+    conn.execute(
+        """
+        INSERT INTO minecraft_users_new
+        SELECT CAST(discord_user_id AS INTEGER), minecraft_username FROM minecraft_users
+        """
+    )
+    conn.execute("DROP TABLE minecraft_users")
+    conn.execute("ALTER TABLE minecraft_users_new RENAME TO minecraft_users")
+
+    conn.execute(
+        """
+        CREATE TABLE experience_new (
+            user_id INTEGER PRIMARY KEY,
+            experience INTEGER NOT NULL DEFAULT 0,
+            level INTEGER NOT NULL DEFAULT 0
+        )"""
+    )
+    conn.execute(
+        """
+        INSERT INTO experience_new
+        SELECT CAST(user_id AS INTEGER), experience, level FROM experience
+        """
+    )
+    conn.execute("DROP TABLE experience")
+    conn.execute("ALTER TABLE experience_new RENAME TO experience")
+    # Covers the leaderboard ORDER BY; ties fall back to the rowid (user_id)
+    conn.execute(
+        """
+        CREATE INDEX idx_experience_level_experience
+        ON experience (level DESC, experience DESC)
+        """
+    )
+
+
+def _index_cooldown_end_time(conn):
+    """Lets the expiry sweeper find expired cooldowns without a full scan."""
+    conn.execute(
+        """
+        CREATE INDEX idx_cooldowns_end_time
+        ON cooldowns (cooldown_end_time)
+        """
+    )
+
+
+def _index_cooldown_channel(conn):
+    """Lets a channel's cooldowns be reset without a full scan."""
+    conn.execute(
+        """
+        CREATE INDEX idx_cooldowns_channel_id
+        ON cooldowns (channel_id)
+        """
+    )
+
+
+def _index_minecraft_username(conn):
+    """
+    Makes Minecraft names unique regardless of case and indexes them.
+
+    Names differing only in case are the same Minecraft account, so if one
+    was linked to several Discord users only the lowest Discord ID keeps it.
+    """
+    conn.execute(
+        """
+        DELETE FROM minecraft_users
+        WHERE discord_user_id NOT IN (
+            SELECT MIN(discord_user_id) FROM minecraft_users
+            GROUP BY minecraft_username COLLATE NOCASE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX idx_minecraft_users_username
+        ON minecraft_users (minecraft_username COLLATE NOCASE)
+        """
+    )
+
+
+def _experience_totals(conn):
+    """
+    Converts the experience column from XP within the current level to total XP.
+
+    The original add_xp stored only the XP left over after the last level up,
+    while everything since cogs/utils/levels.py reads the column as a total.
+    Has to run before the ledger seeds its opening balances from it. Uses the
+    original fixed curve, 5 * l^2 + 50 * l + 100, not the configured one.
+    """
+    cumulative = [0]  # cumulative[l] is the total XP needed to reach level l
+    updates = []
+    for user_id, experience, level in conn.execute(
+        "SELECT user_id, experience, level FROM experience WHERE level > 0"
+    ).fetchall():
+        while len(cumulative) <= level:
+            previous = len(cumulative) - 1
+            cumulative.append(
+                cumulative[-1] + 5 * (previous**2) + (50 * previous) + 100
+            )
+        updates.append((cumulative[level] + experience, user_id))
+    conn.executemany("UPDATE experience SET experience = ? WHERE user_id = ?", updates)
+
+
+def _xp_ledger(conn):
+    """
+    Adds the append-only XP ledger (see ``cogs/utils/ledger.py``).
+
+    Existing totals are carried over as one "opening balance" entry per
+    user, so replaying the ledger gives the same totals as before.
+    """
+    conn.execute(
+        """
+        CREATE TABLE xp_ledger (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT,
+            ts INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX idx_xp_ledger_user_id ON xp_ledger (user_id)")
+    conn.execute("CREATE TABLE xp_ledger_state (ledger_id INTEGER NOT NULL)")
+    conn.execute(
+        "ALTER TABLE experience ADD COLUMN ledger_id INTEGER NOT NULL DEFAULT 0"
+    )
+    conn.execute(
+        """
+        INSERT INTO xp_ledger (user_id, delta, reason, ts)
+        SELECT user_id, experience, 'opening balance', CAST(strftime('%s', 'now') AS INTEGER)
+        FROM experience
+        WHERE experience != 0
+        ORDER BY user_id
+        """
+    )
+    conn.execute(
+        """
+        UPDATE experience
+        SET ledger_id = COALESCE(
+            (SELECT id FROM xp_ledger WHERE xp_ledger.user_id = experience.user_id), 0
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO xp_ledger_state (ledger_id) SELECT COALESCE(MAX(id), 0) FROM xp_ledger"
+    )
+
+
+def _level_curve(conn):
+    """
+    Records which XP curve the stored levels were computed with, so a curve
+    changed while the bot was offline is noticed at startup. Every level so
+    far was computed with the original curve.
+    """
+    conn.execute("CREATE TABLE level_curve (coefficients TEXT NOT NULL)")
+    conn.execute("INSERT INTO level_curve (coefficients) VALUES ('[5, 50, 100]')")
+
+
+MIGRATIONS = [
+    _baseline,
+    _compact_columns,
+    _index_cooldown_end_time,
+    _index_cooldown_channel,
+    _index_minecraft_username,
+    _experience_totals,
+    _xp_ledger,
+    _level_curve,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    """Returns the schema version of the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies every pending migration, each in its own transaction.
+
+    ``conn`` must be in autocommit mode (``isolation_level=None``).
+
+    Returns:
+        A list of the versions that were applied.
+    """
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if get_version(conn) >= version:
+            continue
+        with transaction(conn):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    return applied
@@ -0,0 +1,41 @@
+class MinecraftLinks:
+    """
+    In-memory Discord user <-> Minecraft username links.
+
+    Minecraft names are case-insensitive, so the reverse lookup is keyed by
+    the lowercased name. Both directions are plain dict lookups.
+    """
+
+    def __init__(self):
+        self._names = {}  # discord_user_id -> Minecraft name as it was linked
+        self._users = {}  # lowercased Minecraft name -> discord_user_id
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, rows):
+        """Replaces every link with (discord_user_id, minecraft_username) rows."""
+        self._names.clear()
+        self._users.clear()
+        for discord_user_id, minecraft_username in rows:
+            self.add(discord_user_id, minecraft_username)
+
+    def add(self, discord_user_id, minecraft_username):
+        self.remove(discord_user_id)
+        self._names[discord_user_id] = minecraft_username
+        self._users[minecraft_username.lower()] = discord_user_id
+
+    def remove(self, discord_user_id):
+        """Unlinks a Discord user. Returns the Minecraft name they had, or None."""
+        minecraft_username = self._names.pop(discord_user_id, None)
+        if minecraft_username is not None:
+            self._users.pop(minecraft_username.lower(), None)
+        return minecraft_username
+
+    def get_username(self, discord_user_id):
+        """Returns the Minecraft name linked to a Discord user, or None."""
+        return self._names.get(discord_user_id)
+
+    def get_user_id(self, minecraft_username):
+        """Returns the Discord user linked to a Minecraft name, or None."""
+        return self._users.get(minecraft_username.lower())
@@ -0,0 +1,152 @@
+import bisect
+import collections
+import functools
+import re
+import sqlite3
+import threading
+import time
+
+# Upper bounds (in milliseconds) of the latency histogram buckets; the last
+# bucket catches everything slower.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Collapses whitespace and replaces literals so equivalent statements share a key."""
+    return _WHITESPACE.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+
+class StatementStats:
+    """Latency totals and a histogram for one normalized statement."""
+
+    __slots__ = ("calls", "total_ms", "fetch_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.fetch_ms = 0.0  # Time spent fetching rows after the statement ran
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def percentile(self, fraction):
+        """Returns the upper bucket bound below which ``fraction`` of calls finished."""
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max_ms
+
+
+class QueryStats:
+    """
+    Per-statement latency histograms plus a log of slow statements.
+
+    Statements are recorded from the Database worker thread, so every
+    method is guarded by a lock.
+    """
+
+    def __init__(self, slow_query_ms=100, slow_log_size=50):
+        self.slow_query_ms = slow_query_ms
+        self.slow_log = collections.deque(maxlen=slow_log_size)
+        self._statements = collections.defaultdict(StatementStats)
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed_ms):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements[key]
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            if elapsed_ms >= self.slow_query_ms:
+                self.slow_log.append((time.time(), key, elapsed_ms))
+        if elapsed_ms >= self.slow_query_ms:
+            print(f"Slow query ({elapsed_ms:.1f} ms): {key}")
+
+    def record_fetch(self, sql, elapsed_ms):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements[key]
+            stats.fetch_ms += elapsed_ms
+            stats.total_ms += elapsed_ms
+
+    def top(self, count=10):
+        """Returns the ``count`` statements with the highest total time, as (sql, stats)."""
+        with self._lock:
+            return sorted(
+                self._statements.items(), key=lambda item: item[1].total_ms, reverse=True
+            )[:count]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self.slow_log.clear()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor that reports statement and fetch latency to ``connection.stats``."""
+
+    _sql = None
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._sql = sql
+            self.connection.stats.record(sql, (time.perf_counter() - start) * 1000)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def _timed_fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._sql is not None:
+                self.connection.stats.record_fetch(
+                    self._sql, (time.perf_counter() - start) * 1000
+                )
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    A connection whose cursors record every statement into ``self.stats``.
+
+    Pass it as ``sqlite3.connect(..., factory=TimedConnection)``. Rows read
+    by iterating a cursor directly, instead of calling a fetch method, don't
+    count towards fetch time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = QueryStats()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
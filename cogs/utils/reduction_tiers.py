@@ -0,0 +1,65 @@
+import bisect
+
+# Cooldown reduction tiers.
+#
+# "cooldown_reduction_tiers" in config.json lists [min_level, minutes] pairs:
+# a member whose highest level role is at least min_level gets their
+# cooldowns shortened by that many minutes, using the highest tier reached.
+# The pairs are compiled once into two sorted tuples so a lookup is a single
+# bisect.
+#
+# Configs without the key keep the old rule of "cooldown_reduce_by" minutes
+# for every 20 levels. That rule is compiled into a table up to level 1000,
+# and levels past the table keep scaling by the same formula.
+
+LEGACY_TIER_STEP = 20
+LEGACY_MAX_LEVEL = 1000
+
+
+def compile_tiers(config):
+    """
+    Compiles the reduction tiers from the bot config.
+
+    Returns:
+        A tuple of (min levels, reductions in minutes, minutes added per
+        ``LEGACY_TIER_STEP`` levels past the last tier). The first two are
+        sorted by level; the last is 0 unless the legacy rule is in use.
+
+    Raises:
+        ValueError: If a tier isn't a [min_level, minutes] pair of numbers,
+            or two tiers share a level.
+    """
+    tiers = config.get("cooldown_reduction_tiers")
+    per_step = 0
+    if tiers is None:
+        reduce_by = config.get("cooldown_reduce_by", 0)
+        tiers = [
+            [level, reduce_by * (level // LEGACY_TIER_STEP)]
+            for level in range(
+                LEGACY_TIER_STEP, LEGACY_MAX_LEVEL + 1, LEGACY_TIER_STEP
+            )
+        ]
+        per_step = reduce_by
+    try:
+        pairs = sorted((int(level), minutes + 0) for level, minutes in tiers)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Invalid cooldown reduction tiers {tiers}: expected [min_level, minutes] pairs"
+        ) from None
+    levels = tuple(level for level, _ in pairs)
+    if len(set(levels)) != len(levels):
+        raise ValueError(f"Cooldown reduction tiers repeat a level: {list(levels)}")
+    return levels, tuple(minutes for _, minutes in pairs), per_step
+
+
+def reduction_for(tiers, level):
+    """Returns the cooldown reduction in minutes for a member at ``level``."""
+    levels, reductions, per_step = tiers
+    index = bisect.bisect_right(levels, level) - 1
+    if index < 0:
+        return 0
+    if per_step and index == len(levels) - 1:
+        return reductions[index] + per_step * (
+            (level - levels[index]) // LEGACY_TIER_STEP
+        )
+    return reductions[index]
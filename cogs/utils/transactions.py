@@ -0,0 +1,23 @@
+import contextlib
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    """
+    Runs the block inside ``BEGIN IMMEDIATE`` ... ``COMMIT``, rolling back
+    if it raises.
+
+    ``conn`` must be in autocommit mode (``isolation_level=None``), as every
+    connection to database.db is.
+
+    Examples:
+        with transaction(conn):
+            conn.executemany(query, rows)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,274 @@
+"""
+Offline maintenance for database.db.
+
+Works directly on the database file without connecting to Discord, so bulk
+jobs don't load the live bot. Stop the bot first, or reload the database
+cog afterwards, because the bot's in-memory caches won't see changes made
+here.
+
+Usage:
+    python -m dbtool migrate
+    python -m dbtool integrity --quick
+    python -m dbtool purge
+    python -m dbtool vacuum
+    python -m dbtool analyze
+    python -m dbtool export experience experience.csv
+    python -m dbtool import minecraft_users links.jsonl
+    python -m dbtool recompute
+    python -m dbtool ledger audit
+    python -m dbtool ledger compact --days 90
+    python -m dbtool bench --users 10000
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from cogs.utils import backends, benchmark, bulk, ledger, levels, migrations
+from cogs.utils.transactions import transaction
+
+
+def connect(path, migrate=True):
+    """Opens the database the same way the Database cog does and migrates it."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if migrate:
+        for version in migrations.migrate(conn):
+            print(f"Applied database migration {version}")
+    return conn
+
+
+def load_xp_curve(config_path):
+    """Uses the bot's configured XP curve, so levels match what the bot computes."""
+    if not os.path.exists(config_path):
+        return
+    with open(config_path, "r") as f:
+        levels.configure(json.load(f).get("xp_curve"))
+
+
+def _file_format(args):
+    fmt = args.format or bulk.format_from_filename(args.file)
+    if not fmt:
+        sys.exit(f"Can't tell the format of {args.file}; pass --format csv|jsonl")
+    return fmt
+
+
+def _transaction(conn, func, *args):
+    with transaction(conn):
+        return func(conn, *args)
+
+
+def _file_size(path):
+    return sum(
+        os.path.getsize(path + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(path + suffix)
+    )
+
+
+def cmd_migrate(conn, args):
+    before = migrations.get_version(conn)
+    for version in migrations.migrate(conn):
+        print(f"Applied database migration {version}")
+    after = migrations.get_version(conn)
+    if after == before:
+        print(f"Database is up to date at version {after}")
+    else:
+        print(f"Migrated database from version {before} to {after}")
+
+
+def cmd_integrity(conn, args):
+    pragma = "quick_check" if args.quick else "integrity_check"
+    problems = [
+        row[0] for row in conn.execute(f"PRAGMA {pragma}") if row[0] != "ok"
+    ]
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(f"{len(problems)} problems found")
+    print("No problems found")
+
+
+def cmd_purge(conn, args):
+    start = time.perf_counter()
+    now = int(time.time())
+    purged = 0
+    while True:
+        deleted = backends.purge_expired_cooldowns(conn, now, args.batch_size)
+        purged += deleted
+        if deleted < args.batch_size:
+            break
+    print(f"Purged {purged} expired cooldowns in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_vacuum(conn, args):
+    start = time.perf_counter()
+    if args.into:
+        conn.execute("VACUUM INTO ?", (args.into,))
+        print(
+            f"Wrote a compacted copy to {args.into} ({_file_size(args.into)} bytes) "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return
+    before = _file_size(args.database)
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(
+        f"Vacuumed {before} -> {_file_size(args.database)} bytes "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def cmd_analyze(conn, args):
+    start = time.perf_counter()
+    conn.execute("ANALYZE")
+    indexes = conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0]
+    print(f"Analyzed {indexes} tables and indexes in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_bench(conn, args):
+    benchmark.run(args.backends, args.users)
+
+
+def cmd_export(conn, args):
+    start = time.perf_counter()
+    if args.table == "experience":
+        _transaction(conn, ledger.snapshot)
+    with open(args.file, "w", newline="", encoding="utf-8") as fp:
+        count = bulk.export_file(conn, args.table, fp, _file_format(args), args.chunk_size)
+    print(f"Exported {count} rows from {args.table} in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_import(conn, args):
+    start = time.perf_counter()
+    with open(args.file, "r", newline="", encoding="utf-8") as fp:
+        count = bulk.import_file(conn, args.table, fp, _file_format(args), args.chunk_size)
+    print(f"Imported {count} rows into {args.table} in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_recompute(conn, args):
+    start = time.perf_counter()
+    checked, updated = ledger.recompute_levels(conn, args.chunk_size)
+    print(
+        f"Checked {checked} users and updated {updated} levels "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def cmd_ledger_audit(conn, args):
+    mismatches = _transaction(conn, ledger.audit)
+    for user_id, snapshot_total, ledger_total in mismatches:
+        print(f"{user_id}: snapshot {snapshot_total}, ledger {ledger_total}")
+    print(f"{len(mismatches)} users don't match the ledger")
+    if mismatches:
+        sys.exit(1)
+
+
+def cmd_ledger_rebuild(conn, args):
+    start = time.perf_counter()
+    rebuilt = _transaction(conn, ledger.rebuild)
+    print(f"Rebuilt {rebuilt} snapshots from the ledger in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_ledger_compact(conn, args):
+    start = time.perf_counter()
+    removed = _transaction(conn, ledger.compact, time.time() - args.days * 86400)
+    print(f"Compacted away {removed} ledger entries in {time.perf_counter() - start:.2f}s")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m dbtool", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--database", default="database.db", help="Path to the database file")
+    parser.add_argument(
+        "--config", default="config.json", help="Bot config to read the XP curve from"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser(
+        "migrate", help="Apply pending schema migrations"
+    ).set_defaults(func=cmd_migrate, migrate=False)
+
+    integrity = subparsers.add_parser("integrity", help="Check the database for corruption")
+    integrity.add_argument(
+        "--quick", action="store_true", help="Skip the slower index consistency checks"
+    )
+    integrity.set_defaults(func=cmd_integrity, migrate=False)
+
+    purge = subparsers.add_parser("purge", help="Delete expired cooldowns")
+    purge.add_argument("--batch-size", type=int, default=5000)
+    purge.set_defaults(func=cmd_purge)
+
+    vacuum = subparsers.add_parser("vacuum", help="Rebuild the file to reclaim free pages")
+    vacuum.add_argument(
+        "--into", help="Write a compacted copy here instead, leaving the database as is"
+    )
+    vacuum.set_defaults(func=cmd_vacuum)
+
+    subparsers.add_parser(
+        "analyze", help="Refresh the statistics the query planner uses"
+    ).set_defaults(func=cmd_analyze)
+
+    for name, func, help_text in (
+        ("export", cmd_export, "Export a table to CSV or JSONL"),
+        ("import", cmd_import, "Import a table from CSV or JSONL"),
+    ):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("table", choices=sorted(bulk.TABLES))
+        sub.add_argument("file")
+        sub.add_argument("--format", choices=bulk.FORMATS)
+        sub.add_argument("--chunk-size", type=int, default=5000)
+        sub.set_defaults(func=func)
+
+    recompute = subparsers.add_parser(
+        "recompute", help="Recompute every user's level from their XP"
+    )
+    recompute.add_argument("--chunk-size", type=int, default=50000)
+    recompute.set_defaults(func=cmd_recompute)
+
+    ledger_parser = subparsers.add_parser("ledger", help="Check or compact the XP ledger")
+    ledger_commands = ledger_parser.add_subparsers(dest="ledger_command", required=True)
+    ledger_commands.add_parser(
+        "audit", help="Replay the ledger and report users whose totals don't match"
+    ).set_defaults(func=cmd_ledger_audit)
+    ledger_commands.add_parser(
+        "rebuild", help="Recompute every user's total by replaying the ledger"
+    ).set_defaults(func=cmd_ledger_rebuild)
+    compact = ledger_commands.add_parser(
+        "compact", help="Collapse old ledger entries into one per user"
+    )
+    compact.add_argument("--days", type=int, default=90, help="Keep entries newer than this")
+    compact.set_defaults(func=cmd_ledger_compact)
+
+    bench = subparsers.add_parser(
+        "bench", help="Benchmark the storage backends on throwaway databases"
+    )
+    bench.add_argument(
+        "--backends", nargs="+", choices=backends.BACKENDS, default=list(backends.BACKENDS)
+    )
+    bench.add_argument("--users", type=int, default=10000)
+    bench.set_defaults(func=cmd_bench, uses_database=False)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        load_xp_curve(args.config)
+    except ValueError as e:
+        sys.exit(str(e))
+    if not getattr(args, "uses_database", True):
+        args.func(None, args)
+        return
+    conn = connect(args.database, getattr(args, "migrate", True))
+    try:
+        args.func(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
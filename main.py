@@ -27,6 +27,7 @@ class MyBot(commands.Bot):  # Subclass commands.Bot
     def reload_config(self):
         self.config = self.load_config()
         print("Config reloaded.")
+        self.dispatch("config_reload")  # Lets cogs pick up settings they compiled
 
 
 intents = discord.Intents.all()
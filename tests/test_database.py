@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from cogs.database import Database
+from cogs.utils.backends import MemoryBackend
+
+
+class Bot:
+    def __init__(self, config):
+        self.config = config
+
+
+class HeldBackend(MemoryBackend):
+    """A memory backend whose ``apply_xp`` waits until ``release`` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def apply_xp(self, grants):
+        self.release.wait(5)
+        return super().apply_xp(grants)
+
+
+def test_reads_include_xp_that_is_being_flushed():
+    async def run():
+        database = Database(Bot({"db_backend": "memory", "permitted_roles": []}))
+        await database.cog_load()
+        backend = database.backend = HeldBackend()
+        user = SimpleNamespace(id=1)
+        await database.get_user_level_and_xp_to_next(user)
+        await database.add_xp(user.id, 1000)
+
+        # The read gets to the database first, then the flush takes the
+        # buffer and waits in apply_xp, which can't write until released
+        read = asyncio.create_task(database.get_user_level_and_xp_to_next(user))
+        flush = asyncio.create_task(database.flush_xp())
+        try:
+            during = await asyncio.wait_for(read, 5)
+            in_flight = database._xp_buffer, backend.experience[user.id]
+        finally:
+            backend.release.set()
+        await flush
+        after = await database.get_user_level_and_xp_to_next(user)
+        await database.cog_unload()
+        return in_flight, during, after
+
+    in_flight, during, after = asyncio.run(run())
+    assert in_flight == ({}, (0, 0))
+    assert during == (230, 4, 150)
+    assert after == (230, 4, 150)
+
+
+def test_init_leaves_the_database_to_cog_load(tmp_path):
+    async def run():
+        config = {
+            "db_path": str(tmp_path / "database.db"),
+            "db_backup_dir": str(tmp_path / "backups"),
+            "permitted_roles": [],
+        }
+        database = Database(Bot(config))
+        created = database.backend
+        await database.cog_load()
+        loaded = database.backend.name, database.flush_xp_loop.is_running()
+        await database.cog_unload()
+        return created, loaded
+
+    created, loaded = asyncio.run(run())
+    assert created is None
+    assert loaded == ("sqlite", True)
+    assert (tmp_path / "database.db").exists()
+
+
+class Attachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+
+    async def save(self, path):
+        with open(path, "wb") as fp:
+            fp.write(self.data)
+
+
+def test_import_reports_a_malformed_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = b"discord_user_id,minecraft_username\n1," + b"x" * 200000 + b"\n"
+    sent = []
+
+    async def send(*args, **kwargs):
+        sent.append(kwargs["embed"])
+
+    ctx = SimpleNamespace(
+        message=SimpleNamespace(attachments=[Attachment("users.csv", data)]),
+        send=send,
+    )
+
+    async def run():
+        config = {"db_backend": "sqlite-memory", "permitted_roles": []}
+        database = Database(Bot(config))
+        await database.cog_load()
+        await database.db_import.callback(database, ctx, "minecraft_users")
+        await database.cog_unload()
+
+    asyncio.run(run())
+    assert [embed.title for embed in sent] == ["Error"]
+    assert "field larger than field limit" in sent[0].description
+    assert not (tmp_path / "minecraft_users_import.csv").exists()
@@ -0,0 +1,16 @@
+import pytest
+
+from cogs.utils import levels
+
+
+@pytest.mark.parametrize("curve", [[True, 50, 100], [5, 50, True], [False, 1]])
+def test_compile_curve_rejects_bools(curve):
+    with pytest.raises(ValueError):
+        levels.compile_curve(curve)
+
+
+def test_negative_totals_are_level_zero():
+    assert levels.level_from_xp(-1) == 0
+    assert levels.level_from_xp(-10**6) == 0
+    assert levels.levels_from_xp([-50, 0, 100]) == [0, 0, 1]
+    assert levels.level_progress(-50) == (-50, 0, 150)
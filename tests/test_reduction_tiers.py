@@ -0,0 +1,16 @@
+from cogs.utils import reduction_tiers
+
+
+def test_legacy_rule_keeps_scaling_past_the_table():
+    tiers = reduction_tiers.compile_tiers({"cooldown_reduce_by": 5})
+    for level in (0, 19, 20, 999, 1000, 1019, 1020, 5000, 12345):
+        assert reduction_tiers.reduction_for(tiers, level) == 5 * (level // 20)
+
+
+def test_configured_tiers_stop_at_the_last_tier():
+    tiers = reduction_tiers.compile_tiers(
+        {"cooldown_reduce_by": 5, "cooldown_reduction_tiers": [[10, 1], [50, 3]]}
+    )
+    assert [
+        reduction_tiers.reduction_for(tiers, level) for level in (9, 10, 49, 50, 5000)
+    ] == [0, 1, 1, 3, 3]